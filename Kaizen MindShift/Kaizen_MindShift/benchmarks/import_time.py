@@ -0,0 +1,100 @@
+"""
+Import-time benchmark for the Kaizen components.
+
+Imports each module the pages load in a fresh interpreter, reports the median
+wall time, and fails when a module goes over its budget or pulls in one of the
+heavy libraries that should only load on first use.
+
+Usage (from Kaizen_MindShift/):
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --runs 7 --budget-ms 800
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# modules the pages import, in the order a cold container loads them
+PAGE_MODULES = [
+    "components.Parameter_store",
+    "components.Instrumentation",
+    "components.Aws_clients",
+    "components.Assignment_store",
+    "components.Image_store",
+    "components.Embedding_cache",
+    "components.Generation_cache",
+    "components.Bedrock_streaming",
+    "components.Scoring",
+    "components.Grading",
+    "components.Suggestions",
+    "components.Answer_store",
+    "components.Leaderboard",
+    "components.Bulk_authoring",
+]
+
+# libraries that must stay deferred until first use
+HEAVY_MODULES = ["numpy", "scipy", "PIL.Image", "requests", "pandas"]
+
+# run inside the child interpreter: time the import and list the heavy modules it newly loaded;
+# streamlit is imported by every page anyway, so it is loaded before timing starts
+PROBE = """
+import json, sys, time
+import streamlit
+loaded = set(sys.modules)
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+heavy = [name for name in {heavy!r} if name in sys.modules and name not in loaded]
+print(json.dumps({{"seconds": elapsed, "heavy": heavy}}))
+"""
+
+
+def measure(module, runs):
+    env = dict(os.environ)
+    env.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    code = PROBE.format(module=module, heavy=HEAVY_MODULES)
+    timings = []
+    heavy = set()
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip().splitlines()[-1]
+        result = json.loads(output)
+        timings.append(result["seconds"] * 1000)
+        heavy.update(result["heavy"])
+    return statistics.median(timings), sorted(heavy)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time of the Kaizen page modules")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per module")
+    parser.add_argument("--budget-ms", type=float, default=600.0, help="median import budget per module")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'module':<32} {'median ms':>10}  heavy imports")
+    for module in PAGE_MODULES:
+        median_ms, heavy = measure(module, args.runs)
+        print(f"{module:<32} {median_ms:>10.1f}  {', '.join(heavy) or '-'}")
+        if median_ms > args.budget_ms:
+            failures.append(f"{module} took {median_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+        if heavy:
+            failures.append(f"{module} imports {', '.join(heavy)} at import time")
+
+    if failures:
+        print("\nImport-time regressions:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
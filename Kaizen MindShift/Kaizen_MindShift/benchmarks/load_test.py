@@ -0,0 +1,328 @@
+"""
+Offline load test for the Kaizen create, show and complete flows.
+
+Runs the component calls each page makes against local stand-ins: moto for
+DynamoDB and S3, and a stub Bedrock client with configurable latency and
+deterministic embeddings. Simulated teachers create assignments, then N
+concurrent students open and answer them. The report gives p50/p95/p99 per
+stage and per action, plus the number of remote calls each action makes.
+
+Usage (from Kaizen_MindShift/):
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --students 50 --bedrock-latency-ms 400
+    python benchmarks/load_test.py --max-p95-ms 1500 --max-calls-per-action 12
+"""
+
+import argparse
+import base64
+import hashlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUESTIONS_PER_ASSIGNMENT = 5
+
+
+class StubBedrockClient:
+    """Answers invoke_model calls locally after a simulated latency"""
+
+    def __init__(self, latency_ms, embedding_latency_ms, jitter, dimensions, image_size):
+        self.latency = latency_ms / 1000
+        self.embedding_latency = embedding_latency_ms / 1000
+        self.jitter = jitter
+        self.dimensions = dimensions
+        self.image_size = image_size
+        self._image = None
+        self._lock = threading.Lock()
+
+    def _sleep(self, seconds):
+        time.sleep(max(0.0, random.gauss(seconds, seconds * self.jitter)))
+
+    def _embedding(self, text):
+        # the same text always maps to the same unit-length vector
+        rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+        vector = [rng.gauss(0, 1) for _ in range(self.dimensions)]
+        norm = sum(value * value for value in vector) ** 0.5
+        return [value / norm for value in vector]
+
+    def _image_base64(self):
+        with self._lock:
+            if self._image is None:
+                from PIL import Image
+
+                image = Image.new("RGB", (self.image_size, self.image_size))
+                image.putdata([(x % 256, y % 256, 128) for y in range(self.image_size) for x in range(self.image_size)])
+                output = io.BytesIO()
+                image.save(output, format="PNG")
+                self._image = base64.b64encode(output.getvalue()).decode("ascii")
+            return self._image
+
+    def _response(self, model_id, body):
+        if "embed" in model_id:
+            self._sleep(self.embedding_latency)
+            return {"embedding": self._embedding(body["inputText"])}
+        self._sleep(self.latency)
+        if "canvas" in model_id:
+            return {"images": [self._image_base64()]}
+        if "mistral" in model_id:
+            text = json.dumps({"corrected": body["prompt"][:60], "rephrased": body["prompt"][:60]})
+            return {"outputs": [{"text": text}]}
+        question_answers = [
+            {"Id": index, "Question": f"Question {index}?", "Answer": f"Reference answer {index}."}
+            for index in range(1, QUESTIONS_PER_ASSIGNMENT + 1)
+        ]
+        return {"output": {"message": {"content": [{"text": json.dumps(question_answers)}]}}}
+
+    def invoke_model(self, modelId, body, **kwargs):
+        response = self._response(modelId, json.loads(body))
+        return {"body": io.BytesIO(json.dumps(response).encode("utf-8"))}
+
+    def invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        text = json.dumps(self._response(modelId, json.loads(body)))
+        return {"body": [{"chunk": {"bytes": json.dumps({"outputs": [{"text": text}]}).encode("utf-8")}}]}
+
+
+def create_tables_and_bucket(bucket_name):
+    import boto3
+
+    dynamodb = boto3.resource("dynamodb")
+    dynamodb.create_table(
+        TableName="assignments",
+        KeySchema=[{"AttributeName": "assignment_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "assignment_id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    dynamodb.create_table(
+        TableName="answers",
+        KeySchema=[
+            {"AttributeName": "student_id", "KeyType": "HASH"},
+            {"AttributeName": "assignment_question_id", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "student_id", "AttributeType": "S"},
+            {"AttributeName": "assignment_question_id", "AttributeType": "S"},
+            {"AttributeName": "score", "AttributeType": "N"},
+        ],
+        GlobalSecondaryIndexes=[{
+            "IndexName": "assignment_question_id-index",
+            "KeySchema": [
+                {"AttributeName": "assignment_question_id", "KeyType": "HASH"},
+                {"AttributeName": "score", "KeyType": "RANGE"},
+            ],
+            "Projection": {"ProjectionType": "ALL"},
+        }],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    boto3.client("s3").create_bucket(Bucket=bucket_name)
+
+
+class Recorder:
+    """Collects the spans of every traced action"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.actions = {}
+        self.stages = {}
+        self.calls = {}
+
+    def run(self, action, function, *args):
+        from components.Instrumentation import start_trace
+
+        trace = start_trace(action)
+        started = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.actions.setdefault(action, []).append(elapsed)
+            self.calls.setdefault(action, []).append(len(trace["spans"]))
+            for span in trace["spans"]:
+                self.stages.setdefault(span["stage"], []).append(span["duration"])
+        return result
+
+
+def create_assignment(index):
+    from components.Assignment_store import save_assignment
+    from components.Bedrock_invoke import invoke_model
+    from components.Embedding_cache import EMBEDDING_MODEL_ID, encode_embedding, get_text_embeds
+    from components.Image_store import upload_image_variants
+    from components.Instrumentation import submit_in_context
+
+    prompt = f"Reading material number {index} for the load test."
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        questions = submit_in_context(executor, invoke_model, "amazon.nova-pro-v1:0", {
+            "inferenceConfig": {"max_new_tokens": 1000},
+            "messages": [{"role": "user", "content": [{"text": prompt}]}],
+        })
+        image = submit_in_context(executor, invoke_model, "amazon.nova-canvas-v1:0", {
+            "taskType": "TEXT_IMAGE",
+            "textToImageParams": {"text": f"An image of {prompt}"},
+        })
+        question_answers = json.loads(questions.result()["output"]["message"]["content"][0]["text"])
+        image_bytes = base64.b64decode(image.result()["images"][0])
+
+    assignment_id = str(1_000_000 + index)
+    vectors = get_text_embeds([question_answer["Answer"] for question_answer in question_answers])
+    image_variants = upload_image_variants(assignment_id, image_bytes)
+    save_assignment({
+        "assignment_id": assignment_id,
+        "teacher_id": "load-test",
+        "prompt": prompt,
+        "s3_image_name": image_variants["original"],
+        "image_variants": image_variants,
+        "question_answers": json.dumps(question_answers),
+        "answer_embeddings": {
+            str(question_answer["Id"]): encode_embedding(vector)
+            for question_answer, vector in zip(question_answers, vectors)
+        },
+        "embedding_model_id": EMBEDDING_MODEL_ID,
+    })
+    return assignment_id
+
+
+def show_assignment(assignment_id):
+    from components.Assignment_store import get_assignment, load_assignment_index
+    from components.Image_store import get_display_image
+
+    load_assignment_index()
+    record = get_assignment(assignment_id)
+    get_display_image(record)
+    return record
+
+
+def complete_question(student_id, assignment_id, question_key, answer):
+    from components.Assignment_store import get_assignment, get_question_index
+    from components.Embedding_cache import decode_embedding, get_text_embed
+    from components.Leaderboard import get_leaderboard, submit_score
+    from components.Scoring import score_answer
+    from components.Suggestions import request_suggestions
+
+    record = get_assignment(assignment_id)
+    question = get_question_index(assignment_id)[question_key]
+    suggestions = request_suggestions(answer)
+    score = score_answer(decode_embedding(record["answer_embeddings"][question_key]), get_text_embed(answer))
+    submit_score(student_id, assignment_id, question["Id"], answer, score)
+    get_leaderboard(assignment_id, question["Id"])
+    suggestions.result()
+    return score
+
+
+def student_session(recorder, student, assignment_ids, questions):
+    student_id = f"student-{student}"
+    rng = random.Random(student)
+    assignment_id = rng.choice(assignment_ids)
+    recorder.run("show", show_assignment, assignment_id)
+    for question in range(1, questions + 1):
+        answer = f"{student_id} answer {question} attempt {rng.randint(0, 3)}"
+        recorder.run("complete", complete_question, student_id, assignment_id, str(question), answer)
+
+
+def percentiles(values):
+    values = sorted(values)
+    if len(values) == 1:
+        return values * 3
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return cuts[49], cuts[94], cuts[98]
+
+
+def print_table(title, samples):
+    print(f"\n{title:<56} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, values in sorted(samples.items()):
+        p50, p95, p99 = percentiles(values)
+        print(f"{name:<56} {len(values):>6} {p50 * 1000:>9.1f} {p95 * 1000:>9.1f} {p99 * 1000:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Kaizen flows against local AWS stand-ins")
+    parser.add_argument("--students", type=int, default=20, help="concurrent simulated students")
+    parser.add_argument("--assignments", type=int, default=3, help="assignments created before the students start")
+    parser.add_argument("--questions", type=int, default=QUESTIONS_PER_ASSIGNMENT, help="questions each student answers")
+    parser.add_argument("--bedrock-latency-ms", type=float, default=300.0, help="stub latency of text and image models")
+    parser.add_argument("--embedding-latency-ms", type=float, default=60.0, help="stub latency of the embedding model")
+    parser.add_argument("--jitter", type=float, default=0.2, help="relative standard deviation of the stub latency")
+    parser.add_argument("--dimensions", type=int, default=1024, help="length of the stub embeddings")
+    parser.add_argument("--image-size", type=int, default=1024, help="width and height of the stub image")
+    parser.add_argument("--max-p95-ms", type=float, help="fail when an action's p95 goes over this")
+    parser.add_argument("--max-calls-per-action", type=float, help="fail when an action averages more remote calls")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    if not 1 <= args.questions <= QUESTIONS_PER_ASSIGNMENT:
+        parser.error(f"--questions must be between 1 and {QUESTIONS_PER_ASSIGNMENT}")
+
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+        os.environ[name] = "testing"
+    os.environ["EMBEDDING_CACHE_DB"] = os.path.join(tempfile.mkdtemp(prefix="kaizen-load-"), "embeddings.db")
+    random.seed(0)
+
+    from moto import mock_aws
+
+    with mock_aws():
+        from components.Parameter_store import S3_BUCKET_NAME
+
+        create_tables_and_bucket(S3_BUCKET_NAME)
+
+        from components import Bedrock_invoke
+
+        Bedrock_invoke.bedrock_client = StubBedrockClient(
+            args.bedrock_latency_ms, args.embedding_latency_ms, args.jitter, args.dimensions, args.image_size
+        )
+
+        recorder = Recorder()
+        started = time.perf_counter()
+        assignment_ids = [recorder.run("create", create_assignment, index) for index in range(args.assignments)]
+        with ThreadPoolExecutor(max_workers=args.students) as executor:
+            sessions = [
+                executor.submit(student_session, recorder, student, assignment_ids, args.questions)
+                for student in range(args.students)
+            ]
+            for session in sessions:
+                session.result()
+        wall = time.perf_counter() - started
+
+    print(f"{args.assignments} assignments, {args.students} students x {args.questions} questions in {wall:.2f} s")
+    print_table("stage", recorder.stages)
+    print_table("action", recorder.actions)
+    print(f"\n{'action':<56} {'remote calls (mean)':>20} {'max':>6}")
+    calls_per_action = {}
+    for action, counts in sorted(recorder.calls.items()):
+        calls_per_action[action] = statistics.mean(counts)
+        print(f"{action:<56} {calls_per_action[action]:>20.2f} {max(counts):>6}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "stages": {name: dict(zip(("p50", "p95", "p99"), percentiles(values)))
+                           for name, values in recorder.stages.items()},
+                "actions": {name: dict(zip(("p50", "p95", "p99"), percentiles(values)))
+                            for name, values in recorder.actions.items()},
+                "calls_per_action": calls_per_action,
+            }, f, indent=2)
+
+    failures = []
+    for action, values in sorted(recorder.actions.items()):
+        p95_ms = percentiles(values)[1] * 1000
+        if args.max_p95_ms is not None and p95_ms > args.max_p95_ms:
+            failures.append(f"{action} p95 {p95_ms:.1f} ms (budget {args.max_p95_ms:.0f} ms)")
+        if args.max_calls_per_action is not None and calls_per_action[action] > args.max_calls_per_action:
+            failures.append(
+                f"{action} makes {calls_per_action[action]:.2f} remote calls (budget {args.max_calls_per_action:g})"
+            )
+    if failures:
+        print("\nLoad-test regressions:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
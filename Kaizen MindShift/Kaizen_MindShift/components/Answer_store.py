@@ -0,0 +1,36 @@
+from botocore.exceptions import ClientError
+
+from components.Aws_clients import get_dynamodb_resource
+from components.Instrumentation import timed
+
+answers_table_name = "answers"
+
+dynamodb = get_dynamodb_resource()
+answers_table = dynamodb.Table(answers_table_name)
+
+
+# build the answers table sort key for a question of an assignment
+def assignment_question_key(assignment_id, question_id):
+    return assignment_id + "_" + str(question_id)
+
+
+# store the answer only if it beats the student's best score, in one conditional write;
+# returns True when it was stored and False when the existing score is as high or higher
+def save_high_score(student_id, assignment_id, question_id, answer, score):
+    try:
+        with timed("dynamodb.update_item:answers"):
+            answers_table.update_item(
+                Key={
+                    "student_id": student_id,
+                    "assignment_question_id": assignment_question_key(assignment_id, question_id),
+                },
+                UpdateExpression="SET #score = :new, #answer = :answer",
+                ConditionExpression="attribute_not_exists(#score) OR #score < :new",
+                ExpressionAttributeNames={"#score": "score", "#answer": "answer"},
+                ExpressionAttributeValues={":new": score, ":answer": answer},
+            )
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return False
+        raise
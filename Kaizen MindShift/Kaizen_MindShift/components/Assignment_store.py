@@ -0,0 +1,77 @@
+import json
+
+import streamlit as st
+
+from components.Aws_clients import get_dynamodb_resource
+from components.Instrumentation import timed
+
+assignments_table_name = "assignments"
+
+# seconds a cached assignment listing is served before DynamoDB is read again
+ASSIGNMENT_LIST_TTL = 300
+
+dynamodb = get_dynamodb_resource()
+assignments_table = dynamodb.Table(assignments_table_name)
+
+
+# list assignment ids and prompts only, following LastEvaluatedKey past the 1 MB scan page
+@st.cache_data(ttl=ASSIGNMENT_LIST_TTL, show_spinner=False)
+def list_assignments():
+    scan_kwargs = {
+        "ProjectionExpression": "#id, #prompt",
+        "ExpressionAttributeNames": {"#id": "assignment_id", "#prompt": "prompt"},
+    }
+    assignments = []
+    while True:
+        with timed("dynamodb.scan:assignments"):
+            response = assignments_table.scan(**scan_kwargs)
+        assignments.extend(response["Items"])
+        if "LastEvaluatedKey" not in response:
+            return assignments
+        scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+# fetch one full assignment record by key
+@st.cache_data(ttl=ASSIGNMENT_LIST_TTL, show_spinner=False)
+def get_assignment(assignment_id):
+    with timed("dynamodb.get_item:assignments"):
+        response = assignments_table.get_item(Key={"assignment_id": assignment_id})
+    return response.get("Item")
+
+
+# index the assignment listing by assignment_id, rebuilt only when the listing cache refreshes;
+# cache_resource shares one dict across sessions instead of unpickling a copy per rerun
+@st.cache_resource(ttl=ASSIGNMENT_LIST_TTL, show_spinner=False)
+def load_assignment_index():
+    return {record["assignment_id"]: record for record in list_assignments()}
+
+
+# index the questions of an assignment by question Id
+@st.cache_data(ttl=ASSIGNMENT_LIST_TTL, show_spinner=False)
+def get_question_index(assignment_id):
+    record = get_assignment(assignment_id)
+    if not record:
+        return {}
+    return {
+        str(question_answer["Id"]): question_answer
+        for question_answer in json.loads(record["question_answers"])
+    }
+
+
+# save an assignment record and drop the cached listing so it shows up straight away
+def save_assignment(item):
+    with timed("dynamodb.put_item:assignments"):
+        assignments_table.put_item(Item=item)
+    list_assignments.clear()
+    load_assignment_index.clear()
+
+
+# save many assignment records with batched writes, refreshing the cached listing once
+def save_assignments(items):
+    if not items:
+        return
+    with timed("dynamodb.batch_write_item:assignments"), assignments_table.batch_writer() as batch:
+        for item in items:
+            batch.put_item(Item=item)
+    list_assignments.clear()
+    load_assignment_index.clear()
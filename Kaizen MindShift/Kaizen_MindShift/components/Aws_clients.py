@@ -0,0 +1,39 @@
+import boto3
+import streamlit as st
+from botocore.config import Config
+
+# one connection pool per service, sized for the thread pools in the components, with
+# adaptive client-side retries and TCP keep-alive so warm connections are reused
+AWS_CLIENT_CONFIG = Config(
+    max_pool_connections=50,
+    retries={"max_attempts": 5, "mode": "adaptive"},
+    tcp_keepalive=True,
+    connect_timeout=5,
+    read_timeout=120,
+)
+
+
+# create a client once per process and share it across Streamlit sessions
+@st.cache_resource(show_spinner=False)
+def get_client(service_name):
+    return boto3.session.Session().client(service_name, config=AWS_CLIENT_CONFIG)
+
+
+@st.cache_resource(show_spinner=False)
+def get_resource(service_name):
+    return boto3.session.Session().resource(service_name, config=AWS_CLIENT_CONFIG)
+
+
+# Bedrock retries are owned by components.Bedrock_invoke, so botocore makes a single attempt
+@st.cache_resource(show_spinner=False)
+def get_bedrock_client():
+    config = AWS_CLIENT_CONFIG.merge(Config(retries={"max_attempts": 1, "mode": "standard"}))
+    return boto3.session.Session().client("bedrock-runtime", config=config)
+
+
+def get_s3_client():
+    return get_client("s3")
+
+
+def get_dynamodb_resource():
+    return get_resource("dynamodb")
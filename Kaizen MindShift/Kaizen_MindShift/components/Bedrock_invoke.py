@@ -0,0 +1,224 @@
+import json
+import os
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+from components.Aws_clients import get_bedrock_client
+from components.Instrumentation import timed
+
+# requests per second and burst size allowed per model id before callers wait for a token
+BEDROCK_REQUESTS_PER_SECOND = float(os.environ.get("BEDROCK_REQUESTS_PER_SECOND", "10"))
+BEDROCK_BURST = int(os.environ.get("BEDROCK_BURST", "20"))
+
+# calls in flight per model id
+BEDROCK_MAX_CONCURRENCY = int(os.environ.get("BEDROCK_MAX_CONCURRENCY", "16"))
+
+# retries with full-jitter exponential backoff for throttling and transient errors
+BEDROCK_MAX_ATTEMPTS = int(os.environ.get("BEDROCK_MAX_ATTEMPTS", "6"))
+BACKOFF_BASE_SECONDS = 0.25
+BACKOFF_CAP_SECONDS = 8.0
+
+# consecutive failures that open a model's circuit, and how long it stays open
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_SECONDS = 30.0
+
+THROTTLING_ERRORS = {"ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException"}
+RETRYABLE_ERRORS = THROTTLING_ERRORS | {
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+    "ModelTimeoutException",
+    "InternalServerException",
+}
+
+bedrock_client = get_bedrock_client()
+
+
+class BedrockUnavailableError(Exception):
+    """Raised when a model call is refused by the circuit breaker or runs out of retries"""
+
+
+class TokenBucket:
+    """Token-bucket rate limiter; acquire() blocks until a token is available"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets one trial call through once the reset time passes"""
+
+    def __init__(self, failure_threshold, reset_seconds):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_seconds or self.trial_in_flight:
+                return False
+            self.trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class ModelGuard:
+    """Rate limiter, concurrency limit, circuit breaker and metrics for one model id"""
+
+    def __init__(self):
+        self.bucket = TokenBucket(BEDROCK_REQUESTS_PER_SECOND, BEDROCK_BURST)
+        self.slots = threading.BoundedSemaphore(BEDROCK_MAX_CONCURRENCY)
+        self.breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS)
+        self.lock = threading.Lock()
+        self.metrics = {
+            "calls": 0,
+            "errors": 0,
+            "throttles": 0,
+            "retries": 0,
+            "rejected": 0,
+            "latency_seconds_total": 0.0,
+            "latency_seconds_max": 0.0,
+        }
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.metrics[name] += value
+
+    def observe_latency(self, seconds):
+        with self.lock:
+            self.metrics["calls"] += 1
+            self.metrics["latency_seconds_total"] += seconds
+            self.metrics["latency_seconds_max"] = max(self.metrics["latency_seconds_max"], seconds)
+
+
+_guards_lock = threading.Lock()
+_guards = {}
+
+
+def _guard(model_id):
+    with _guards_lock:
+        guard = _guards.get(model_id)
+        if guard is None:
+            guard = _guards[model_id] = ModelGuard()
+        return guard
+
+
+# snapshot of the per-model call, throttle and latency counters
+def get_metrics():
+    with _guards_lock:
+        guards = dict(_guards)
+    metrics = {}
+    for model_id, guard in guards.items():
+        with guard.lock:
+            metrics[model_id] = dict(guard.metrics)
+        calls = metrics[model_id]["calls"]
+        metrics[model_id]["latency_seconds_avg"] = (
+            metrics[model_id]["latency_seconds_total"] / calls if calls else 0.0
+        )
+    return metrics
+
+
+# run one Bedrock request under the model's rate limit, concurrency limit and circuit breaker,
+# retrying throttling and transient errors with full-jitter exponential backoff
+def call_with_guard(model_id, request):
+    guard = _guard(model_id)
+    for attempt in range(BEDROCK_MAX_ATTEMPTS):
+        if not guard.breaker.allow():
+            guard.count("rejected")
+            raise BedrockUnavailableError(f"'{model_id}' is temporarily unavailable after repeated failures")
+
+        guard.bucket.acquire()
+        with guard.slots:
+            started = time.monotonic()
+            try:
+                response = request()
+            except ClientError as e:
+                guard.observe_latency(time.monotonic() - started)
+                code = e.response["Error"]["Code"]
+                if code in THROTTLING_ERRORS:
+                    guard.count("throttles")
+                if code not in RETRYABLE_ERRORS:
+                    # a bad request says nothing about the model's health
+                    guard.count("errors")
+                    guard.breaker.record_success()
+                    raise
+                guard.breaker.record_failure()
+                last_error = e
+            except Exception:
+                guard.observe_latency(time.monotonic() - started)
+                guard.count("errors")
+                guard.breaker.record_failure()
+                raise
+            else:
+                guard.observe_latency(time.monotonic() - started)
+                guard.breaker.record_success()
+                return response
+
+        if attempt + 1 < BEDROCK_MAX_ATTEMPTS:
+            guard.count("retries")
+            time.sleep(random.uniform(0, min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)))
+
+    guard.count("errors")
+    raise BedrockUnavailableError(
+        f"'{model_id}' failed after {BEDROCK_MAX_ATTEMPTS} attempts. Reason: {last_error}"
+    ) from last_error
+
+
+# invoke a model with a JSON body and return the parsed JSON response
+def invoke_model(model_id, body):
+    with timed(f"bedrock.invoke_model:{model_id}") as span:
+        response = call_with_guard(model_id, lambda: bedrock_client.invoke_model(
+            modelId=model_id,
+            body=json.dumps(body),
+            accept="application/json",
+            contentType="application/json",
+        ))
+        raw = response["body"].read()
+        span["bytes"] = len(raw)
+    return json.loads(raw)
+
+
+# start a streamed model call; only opening the stream is guarded and retried
+def invoke_model_with_response_stream(model_id, body):
+    with timed(f"bedrock.open_stream:{model_id}"):
+        return call_with_guard(model_id, lambda: bedrock_client.invoke_model_with_response_stream(
+            modelId=model_id,
+            body=json.dumps(body),
+            accept="application/json",
+            contentType="application/json",
+        ))
@@ -0,0 +1,70 @@
+import json
+
+from components.Bedrock_invoke import invoke_model_with_response_stream
+
+
+# pull the generated text out of one streamed chunk (Nova messages or Mistral completions)
+def _chunk_text(payload):
+    delta = payload.get("contentBlockDelta", {}).get("delta", {})
+    if "text" in delta:
+        return delta["text"]
+    outputs = payload.get("outputs")
+    if outputs:
+        return "".join(output.get("text", "") for output in outputs)
+    return None
+
+
+# call a model with invoke_model_with_response_stream and yield text as it arrives
+def stream_model_text(model_id, body):
+    response = invoke_model_with_response_stream(model_id, body)
+    for event in response["body"]:
+        chunk = event.get("chunk")
+        if not chunk:
+            continue
+        text = _chunk_text(json.loads(chunk["bytes"]))
+        if text:
+            yield text
+
+
+# yield each top-level JSON object from a stream of text chunks as soon as its closing brace arrives;
+# objects inside a surrounding list are yielded one by one, prose and code fences around them are skipped
+def iter_json_objects(chunks):
+    depth = 0
+    in_string = False
+    escape = False
+    buffer = []
+    for chunk in chunks:
+        for char in chunk:
+            if depth == 0 and char != "{":
+                continue
+            buffer.append(char)
+            if in_string:
+                if escape:
+                    escape = False
+                elif char == "\\":
+                    escape = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    text = "".join(buffer)
+                    buffer = []
+                    try:
+                        yield json.loads(text)
+                    except json.JSONDecodeError:
+                        continue
+
+
+# write streamed text into a Streamlit placeholder as it arrives and return the full text
+def write_stream_to_placeholder(placeholder, chunks):
+    text = ""
+    for chunk in chunks:
+        text += chunk
+        placeholder.markdown(text + "▌")
+    placeholder.markdown(text)
+    return text
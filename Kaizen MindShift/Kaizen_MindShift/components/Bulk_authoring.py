@@ -0,0 +1,94 @@
+import csv
+import io
+import json
+import os
+import queue
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from components.Assignment_store import save_assignments
+from components.Instrumentation import submit_in_context
+
+# rows authored at the same time; Bedrock_invoke still applies its per-model rate limits
+BULK_MAX_WORKERS = int(os.environ.get("BULK_MAX_WORKERS", "4"))
+
+# largest upload accepted in one bulk run
+BULK_MAX_ROWS = 500
+
+# finished assignments are written to DynamoDB in batches of this size (the BatchWriteItem limit)
+BULK_WRITE_BATCH = 25
+
+
+# read the source sentences of a CSV or JSONL upload; CSV uses the "text" column when
+# there is one and the first column otherwise, JSONL lines are strings or {"text": ...}
+def parse_source_file(file_name, data):
+    content = data.decode("utf-8-sig") if isinstance(data, bytes) else data
+    texts = []
+    if file_name.lower().endswith((".jsonl", ".ndjson")):
+        for line_number, line in enumerate(content.splitlines(), start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, dict):
+                if "text" not in record:
+                    raise ValueError(f"Line {line_number} has no 'text' key")
+                record = record["text"]
+            texts.append(str(record))
+    else:
+        rows = list(csv.reader(io.StringIO(content)))
+        column = 0
+        if rows:
+            header = [cell.strip().lower() for cell in rows[0]]
+            if "text" in header:
+                column = header.index("text")
+                rows = rows[1:]
+        texts = [row[column] for row in rows if len(row) > column]
+
+    texts = [text.strip() for text in texts if text.strip()]
+    if len(texts) > BULK_MAX_ROWS:
+        raise ValueError(f"The file has {len(texts)} rows; the limit is {BULK_MAX_ROWS}")
+    return texts
+
+
+def _author(index, row, author_row, events):
+    return author_row(row, lambda status: events.put((index, status, None)))
+
+
+# author every row on a bounded worker pool and yield (index, status, detail) progress events;
+# author_row(row, report) returns the assignment item and may call report(status) between steps.
+# Events are yielded on the calling thread, so the page can update its widgets from them.
+def author_rows(rows, author_row, max_workers=BULK_MAX_WORKERS, poll_interval=0.2):
+    events = queue.Queue()
+    finished = []
+
+    def flush():
+        save_assignments([item for _, item in finished])
+        saved = [(index, "saved", item) for index, item in finished]
+        finished.clear()
+        return saved
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(rows) or 1))) as executor:
+        futures = {
+            submit_in_context(executor, _author, index, row, author_row, events): index
+            for index, row in enumerate(rows)
+        }
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            while not events.empty():
+                yield events.get_nowait()
+
+            for future in done:
+                index = futures[future]
+                try:
+                    finished.append((index, future.result()))
+                    yield index, "generated", None
+                except Exception as ex:
+                    yield index, "failed", ex
+
+            if len(finished) >= BULK_WRITE_BATCH:
+                yield from flush()
+
+    while not events.empty():
+        yield events.get_nowait()
+    if finished:
+        yield from flush()
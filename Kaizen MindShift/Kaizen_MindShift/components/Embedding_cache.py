@@ -0,0 +1,130 @@
+import base64
+import hashlib
+import os
+import sqlite3
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from components.Bedrock_invoke import invoke_model
+from components.Instrumentation import submit_in_context
+
+EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v2:0"
+
+# in-process tier size (number of vectors) and location of the persistent tier
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "4096"))
+EMBEDDING_CACHE_DB = os.environ.get("EMBEDDING_CACHE_DB", "embedding-cache.db")
+
+_lock = threading.Lock()
+_memory_cache = OrderedDict()
+_db_connection = None
+
+
+# create a content-addressed key for an embedding from the model id and the text
+def embedding_cache_key(model_id, text):
+    digest = hashlib.sha256()
+    digest.update(model_id.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _get_db():
+    global _db_connection
+    if _db_connection is None:
+        _db_connection = sqlite3.connect(EMBEDDING_CACHE_DB, check_same_thread=False)
+        _db_connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        _db_connection.commit()
+    return _db_connection
+
+
+def _remember(key, vector):
+    # caller holds _lock
+    _memory_cache[key] = vector
+    _memory_cache.move_to_end(key)
+    while len(_memory_cache) > EMBEDDING_CACHE_SIZE:
+        _memory_cache.popitem(last=False)
+
+
+def _lookup(key):
+    with _lock:
+        vector = _memory_cache.get(key)
+        if vector is not None:
+            _memory_cache.move_to_end(key)
+            return vector
+
+        row = _get_db().execute(
+            "SELECT vector FROM embeddings WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        vector = array("f", row[0]).tolist()
+        _remember(key, vector)
+        return vector
+
+
+def _store(key, vector):
+    with _lock:
+        _remember(key, vector)
+        db = _get_db()
+        db.execute(
+            "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+            (key, array("f", vector).tobytes()),
+        )
+        db.commit()
+
+
+# call the Titan embedding model for a piece of text
+def invoke_text_embed(payload, model_id=EMBEDDING_MODEL_ID):
+    input_body = {
+        "inputText": payload,
+    }
+    embedding_response = invoke_model(model_id, input_body)
+    return list(embedding_response['embedding'])
+
+
+# return the embedding of a piece of text, only calling the model on a cache miss
+def get_text_embed(payload, model_id=EMBEDDING_MODEL_ID):
+    key = embedding_cache_key(model_id, payload)
+    vector = _lookup(key)
+    if vector is None:
+        vector = invoke_text_embed(payload, model_id)
+        _store(key, vector)
+    return vector
+
+
+# embed several texts in one step, calling the model concurrently for the cache misses
+def get_text_embeds(payloads, model_id=EMBEDDING_MODEL_ID, max_workers=5):
+    vectors = {}
+    misses = []
+    for payload in payloads:
+        if payload in vectors or payload in misses:
+            continue
+        vector = _lookup(embedding_cache_key(model_id, payload))
+        if vector is None:
+            misses.append(payload)
+        else:
+            vectors[payload] = vector
+
+    if misses:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(misses))) as executor:
+            futures = [submit_in_context(executor, invoke_text_embed, payload, model_id) for payload in misses]
+            for payload, vector in zip(misses, (future.result() for future in futures)):
+                _store(embedding_cache_key(model_id, payload), vector)
+                vectors[payload] = vector
+
+    return [vectors[payload] for payload in payloads]
+
+
+# pack an embedding as little-endian float16 and base64 it for storage on a DynamoDB item
+def encode_embedding(vector):
+    return base64.b64encode(struct.pack(f"<{len(vector)}e", *vector)).decode("ascii")
+
+
+def decode_embedding(text):
+    raw = base64.b64decode(text)
+    return list(struct.unpack(f"<{len(raw) // 2}e", raw))
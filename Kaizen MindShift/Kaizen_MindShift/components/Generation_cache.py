@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# how long a generated result is reused, and the upper bound on the cached result sizes
+GENERATION_CACHE_TTL = int(os.environ.get("GENERATION_CACHE_TTL", str(24 * 60 * 60)))
+GENERATION_CACHE_MAX_BYTES = int(os.environ.get("GENERATION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+_lock = threading.Lock()
+_generation_cache = OrderedDict()
+_generation_cache_bytes = 0
+
+
+# create a key for a generation request from everything that determines its output
+def generation_cache_key(model_id, prompt, inference_config=None, seed=None):
+    request = json.dumps(
+        {"model_id": model_id, "prompt": prompt, "config": inference_config, "seed": seed},
+        sort_keys=True,
+    )
+    return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+
+def _result_size(result):
+    if isinstance(result, (bytes, bytearray)):
+        return len(result)
+    return len(json.dumps(result, default=str))
+
+
+def _cache_get(key):
+    global _generation_cache_bytes
+    with _lock:
+        entry = _generation_cache.get(key)
+        if entry is None:
+            return None
+        expires_at, result, size = entry
+        if expires_at < time.monotonic():
+            del _generation_cache[key]
+            _generation_cache_bytes -= size
+            return None
+        _generation_cache.move_to_end(key)
+        return result
+
+
+def _cache_put(key, result):
+    global _generation_cache_bytes
+    size = _result_size(result)
+    if size > GENERATION_CACHE_MAX_BYTES:
+        return
+    with _lock:
+        previous = _generation_cache.pop(key, None)
+        if previous is not None:
+            _generation_cache_bytes -= previous[2]
+        _generation_cache[key] = (time.monotonic() + GENERATION_CACHE_TTL, result, size)
+        _generation_cache_bytes += size
+        while _generation_cache_bytes > GENERATION_CACHE_MAX_BYTES:
+            _, (_, _, evicted_size) = _generation_cache.popitem(last=False)
+            _generation_cache_bytes -= evicted_size
+
+
+# return the cached result of a generation request, calling generate() on a miss or when refresh is set
+def get_or_generate(model_id, prompt, generate, inference_config=None, seed=None, refresh=False):
+    key = generation_cache_key(model_id, prompt, inference_config, seed)
+    if not refresh:
+        result = _cache_get(key)
+        if result is not None:
+            return result
+
+    result = generate()
+    _cache_put(key, result)
+    return result
@@ -0,0 +1,187 @@
+import argparse
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+
+from boto3.dynamodb.conditions import Attr
+
+from components.Answer_store import answers_table, assignment_question_key
+from components.Aws_clients import get_dynamodb_resource
+from components.Embedding_cache import EMBEDDING_MODEL_ID, decode_embedding, get_text_embeds
+from components.Instrumentation import timed
+
+assignments_table_name = "assignments"
+
+# number of graded answers whose results are remembered per session
+GRADING_MEMO_SIZE = 50
+
+dynamodb = get_dynamodb_resource()
+
+
+# identify one grading request; the answer is hashed so long answers make compact keys
+def grading_key(student_id, assignment_id, question_id, answer):
+    answer_hash = hashlib.sha256(answer.encode("utf-8")).hexdigest()
+    return (student_id, assignment_id, str(question_id), answer_hash)
+
+
+# return the memo of pipeline stage results for a grading request, kept in e.g. st.session_state
+def grading_memo(state, key):
+    memos = state.get("grading_results")
+    if memos is None:
+        memos = state["grading_results"] = OrderedDict()
+    memo = memos.get(key)
+    if memo is None:
+        memo = memos[key] = {}
+        while len(memos) > GRADING_MEMO_SIZE:
+            memos.popitem(last=False)
+    else:
+        memos.move_to_end(key)
+    return memo
+
+
+# run a pipeline stage once per grading request, so reruns of the page do no remote work
+def cached_stage(memo, stage, compute):
+    if stage not in memo:
+        memo[stage] = compute()
+    return memo[stage]
+
+
+# score each answer against its reference with one matrix operation (100 - cosine distance * 100)
+def score_answers(reference_vectors, answer_vectors):
+    # numpy is only needed for bulk grading, so the pages do not pay for importing it
+    import numpy as np
+
+    references = np.asarray(reference_vectors, dtype=np.float64)
+    answers = np.asarray(answer_vectors, dtype=np.float64)
+    norms = np.linalg.norm(references, axis=1) * np.linalg.norm(answers, axis=1)
+    dots = np.einsum("ij,ij->i", references, answers)
+    similarity = np.divide(dots, norms, out=np.zeros_like(dots), where=norms != 0)
+    return (100 - (1 - similarity) * 100).astype(int).tolist()
+
+
+# fetch assignment records by key, 100 keys per BatchGetItem request
+def get_assignments_by_id(assignment_ids):
+    records = {}
+    assignment_ids = list(dict.fromkeys(assignment_ids))
+    for start in range(0, len(assignment_ids), 100):
+        request = {
+            assignments_table_name: {
+                "Keys": [{"assignment_id": assignment_id} for assignment_id in assignment_ids[start:start + 100]]
+            }
+        }
+        while request:
+            with timed("dynamodb.batch_get_item:assignments"):
+                response = dynamodb.batch_get_item(RequestItems=request)
+            for record in response["Responses"].get(assignments_table_name, []):
+                records[record["assignment_id"]] = record
+            request = response.get("UnprocessedKeys")
+    return records
+
+
+# resolve the reference vector of every (assignment_id, question_id) pair
+def load_reference_vectors(question_keys, max_workers=8):
+    assignments = get_assignments_by_id([assignment_id for assignment_id, _ in question_keys])
+
+    vectors = {}
+    missing = {}
+    for assignment_id, question_id in question_keys:
+        record = assignments.get(assignment_id)
+        if record is None:
+            logging.warning(f"Assignment {assignment_id} not found, skipping")
+            continue
+        answer_embeddings = record.get("answer_embeddings") or {}
+        encoded = answer_embeddings.get(str(question_id))
+        if encoded and record.get("embedding_model_id") == EMBEDDING_MODEL_ID:
+            vectors[(assignment_id, question_id)] = decode_embedding(encoded)
+            continue
+        for question_answer in json.loads(record["question_answers"]):
+            if str(question_answer["Id"]) == str(question_id):
+                missing[(assignment_id, question_id)] = question_answer["Answer"]
+                break
+
+    if missing:
+        embedded = get_text_embeds(list(missing.values()), max_workers=max_workers)
+        vectors.update(zip(missing.keys(), embedded))
+    return vectors
+
+
+# grade (student_id, assignment_id, question_id, answer) tuples in bulk
+def grade_submissions(submissions, max_workers=8):
+    question_keys = list(dict.fromkeys(
+        (assignment_id, str(question_id)) for _, assignment_id, question_id, _ in submissions
+    ))
+    references = load_reference_vectors(question_keys, max_workers=max_workers)
+
+    gradable = [
+        submission for submission in submissions
+        if (submission[1], str(submission[2])) in references and submission[3]
+    ]
+    if not gradable:
+        return []
+
+    answer_vectors = get_text_embeds([answer for _, _, _, answer in gradable], max_workers=max_workers)
+    reference_vectors = [references[(assignment_id, str(question_id))] for _, assignment_id, question_id, _ in gradable]
+    scores = score_answers(reference_vectors, answer_vectors)
+
+    return [
+        {
+            "student_id": student_id,
+            "assignment_id": assignment_id,
+            "question_id": question_id,
+            "answer": answer,
+            "score": score,
+        }
+        for (student_id, assignment_id, question_id, answer), score in zip(gradable, scores)
+    ]
+
+
+# write graded results back to the answers table with BatchWriteItem
+def write_grades(results):
+    with timed("dynamodb.batch_write_item:answers"), answers_table.batch_writer(overwrite_by_pkeys=["student_id", "assignment_question_id"]) as batch:
+        for result in results:
+            batch.put_item(
+                Item={
+                    "student_id": result["student_id"],
+                    "assignment_question_id": assignment_question_key(result["assignment_id"], result["question_id"]),
+                    "answer": result["answer"],
+                    "score": result["score"],
+                }
+            )
+
+
+# read every stored answer (optionally for one assignment) following LastEvaluatedKey
+def get_stored_answers(assignment_id=None):
+    scan_kwargs = {"ProjectionExpression": "student_id, assignment_question_id, answer"}
+    if assignment_id:
+        scan_kwargs["FilterExpression"] = Attr("assignment_question_id").begins_with(assignment_id + "_")
+
+    submissions = []
+    while True:
+        with timed("dynamodb.scan:answers"):
+            response = answers_table.scan(**scan_kwargs)
+        for record in response["Items"]:
+            stored_assignment_id, question_id = record["assignment_question_id"].rsplit("_", 1)
+            submissions.append((record["student_id"], stored_assignment_id, question_id, record.get("answer")))
+        if "LastEvaluatedKey" not in response:
+            return submissions
+        scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+# regrade a whole cohort, e.g. after the embedding model changes
+def regrade_answers(assignment_id=None, max_workers=8, dry_run=False):
+    results = grade_submissions(get_stored_answers(assignment_id), max_workers=max_workers)
+    if not dry_run:
+        write_grades(results)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Regrade stored answers against the reference answers")
+    parser.add_argument("--assignment-id", help="only regrade answers for this assignment")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent embedding calls")
+    parser.add_argument("--dry-run", action="store_true", help="print scores without writing them")
+    args = parser.parse_args()
+
+    for result in regrade_answers(args.assignment_id, args.workers, args.dry_run):
+        print(f"{result['student_id']}\t{result['assignment_id']}_{result['question_id']}\t{result['score']}")
@@ -0,0 +1,159 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+
+from components.Aws_clients import get_s3_client
+from components.Instrumentation import submit_in_context, timed
+from components.Parameter_store import S3_BUCKET_NAME
+
+# width the assignment pages display images at
+THUMBNAIL_WIDTH = 128
+
+# widths of the WebP derivatives uploaded next to each generated image
+IMAGE_VARIANT_WIDTHS = (128, 512)
+
+# upper bound on the total size of the cached image bytes
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# objects above the threshold go up as a multipart upload with parts sent in parallel
+IMAGE_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=4,
+)
+
+s3_client = get_s3_client()
+
+_lock = threading.Lock()
+_image_cache = OrderedDict()
+_image_cache_bytes = 0
+
+
+def _cache_get(key):
+    with _lock:
+        data = _image_cache.get(key)
+        if data is not None:
+            _image_cache.move_to_end(key)
+        return data
+
+
+def _cache_put(key, data):
+    global _image_cache_bytes
+    if len(data) > IMAGE_CACHE_MAX_BYTES:
+        return
+    with _lock:
+        previous = _image_cache.pop(key, None)
+        if previous is not None:
+            _image_cache_bytes -= len(previous)
+        _image_cache[key] = data
+        _image_cache_bytes += len(data)
+        while _image_cache_bytes > IMAGE_CACHE_MAX_BYTES:
+            _, evicted = _image_cache.popitem(last=False)
+            _image_cache_bytes -= len(evicted)
+
+
+# read an S3 object straight into memory
+def fetch_image_bytes(image_name):
+    try:
+        with timed("s3.get_object") as span:
+            response = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=image_name)
+            data = response["Body"].read()
+            span["bytes"] = len(data)
+        return data
+    except ClientError as e:
+        logging.error(e)
+        return None
+
+
+# return PNG bytes of an image resized to the displayed width, or None if it cannot be fetched
+def get_thumbnail(image_name, width=THUMBNAIL_WIDTH):
+    cache_key = (image_name, width)
+    thumbnail = _cache_get(cache_key)
+    if thumbnail is not None:
+        return thumbnail
+
+    image_bytes = fetch_image_bytes(image_name)
+    if image_bytes is None:
+        return None
+
+    from PIL import Image
+
+    image = Image.open(BytesIO(image_bytes))
+    image.thumbnail((width, width))
+    output = BytesIO()
+    image.save(output, format="PNG", optimize=True)
+    thumbnail = output.getvalue()
+
+    _cache_put(cache_key, thumbnail)
+    return thumbnail
+
+
+# resize the generated image into WebP derivatives, one per width in IMAGE_VARIANT_WIDTHS
+def build_image_variants(image_bytes):
+    from PIL import Image
+
+    image = Image.open(BytesIO(image_bytes))
+    image.load()
+    variants = {}
+    for width in IMAGE_VARIANT_WIDTHS:
+        resized = image.copy()
+        resized.thumbnail((width, width))
+        output = BytesIO()
+        resized.save(output, format="WEBP", quality=80, method=4)
+        variants[width] = output.getvalue()
+    return variants
+
+
+def _put_object(object_name, data, content_type):
+    with timed("s3.upload", len(data)):
+        s3_client.upload_fileobj(
+            BytesIO(data),
+            S3_BUCKET_NAME,
+            object_name,
+            ExtraArgs={"ContentType": content_type},
+            Config=IMAGE_TRANSFER_CONFIG,
+        )
+    return object_name
+
+
+# upload the original PNG and its derivatives in parallel, returning the S3 key of every variant
+def upload_image_variants(assignment_id, image_bytes):
+    uploads = {"original": (f"generated_images/{assignment_id}.png", image_bytes, "image/png")}
+    for width, data in build_image_variants(image_bytes).items():
+        uploads[str(width)] = (f"generated_images/{assignment_id}_{width}.webp", data, "image/webp")
+
+    with ThreadPoolExecutor(max_workers=len(uploads)) as executor:
+        futures = {name: submit_in_context(executor, _put_object, *upload) for name, upload in uploads.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+# pick the key of the smallest stored variant at least as wide as the display width
+def pick_image_key(record, width=THUMBNAIL_WIDTH):
+    variants = record.get("image_variants") or {}
+    widths = sorted(int(variant_width) for variant_width in variants if variant_width.isdigit())
+    for variant_width in widths:
+        if variant_width >= width:
+            return variants[str(variant_width)], variant_width
+    return record["s3_image_name"], None
+
+
+# return image bytes for an assignment at the display width, preferring a stored derivative
+def get_display_image(record, width=THUMBNAIL_WIDTH):
+    image_name, variant_width = pick_image_key(record, width)
+    if variant_width != width:
+        return get_thumbnail(image_name, width)
+
+    cache_key = (image_name, width)
+    image_bytes = _cache_get(cache_key)
+    if image_bytes is None:
+        image_bytes = fetch_image_bytes(image_name)
+        if image_bytes is None:
+            return None
+        _cache_put(cache_key, image_bytes)
+    return image_bytes
@@ -0,0 +1,152 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+
+# set KAIZEN_DEV_PANEL=1 to show the per-rerun timing waterfall in the sidebar
+DEV_PANEL_ENABLED = os.environ.get("KAIZEN_DEV_PANEL", "0") == "1"
+
+# upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+logger = logging.getLogger("kaizen.timing")
+
+_current_trace = contextvars.ContextVar("kaizen_trace", default=None)
+_lock = threading.Lock()
+_stage_stats = {}
+
+
+# start collecting the spans of one page rerun; spans from other threads join it via submit_in_context
+def start_trace(name):
+    trace = {"name": name, "started": time.perf_counter(), "spans": [], "lock": threading.Lock()}
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def _record(stage, started, duration, payload_bytes, error):
+    with _lock:
+        stats = _stage_stats.get(stage)
+        if stats is None:
+            stats = _stage_stats[stage] = {
+                "count": 0, "errors": 0, "seconds": 0.0, "bytes": 0, "buckets": [0] * len(LATENCY_BUCKETS)
+            }
+        stats["count"] += 1
+        stats["seconds"] += duration
+        stats["bytes"] += payload_bytes or 0
+        if error:
+            stats["errors"] += 1
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if duration <= bound:
+                stats["buckets"][index] += 1
+
+    trace = _current_trace.get()
+    offset = None
+    if trace is not None:
+        offset = started - trace["started"]
+        with trace["lock"]:
+            trace["spans"].append({
+                "stage": stage, "offset": offset, "duration": duration, "bytes": payload_bytes, "error": error
+            })
+
+    logger.info(json.dumps({
+        "event": "stage_timing",
+        "trace": trace["name"] if trace else None,
+        "stage": stage,
+        "offset_ms": round(offset * 1000, 2) if offset is not None else None,
+        "duration_ms": round(duration * 1000, 2),
+        "bytes": payload_bytes,
+        "error": error,
+    }))
+
+
+# time a block as one stage; set span["bytes"] inside the block to record the payload size
+@contextmanager
+def timed(stage, payload_bytes=None):
+    span = {"bytes": payload_bytes}
+    started = time.perf_counter()
+    error = None
+    try:
+        yield span
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _record(stage, started, time.perf_counter() - started, span["bytes"], error)
+
+
+# decorator form of timed(); payload_size(result) returns the payload size in bytes
+def timed_call(stage, payload_size=None):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with timed(stage) as span:
+                result = function(*args, **kwargs)
+                if payload_size is not None and result is not None:
+                    span["bytes"] = payload_size(result)
+                return result
+        return wrapper
+    return decorator
+
+
+# submit work to a thread pool so its spans are recorded on the caller's trace
+def submit_in_context(executor, function, *args, **kwargs):
+    return executor.submit(contextvars.copy_context().run, function, *args, **kwargs)
+
+
+# per-stage counters and latency histograms in the Prometheus text exposition format
+def prometheus_text():
+    with _lock:
+        stats = {stage: dict(values, buckets=list(values["buckets"])) for stage, values in _stage_stats.items()}
+
+    lines = [
+        "# TYPE kaizen_stage_seconds histogram",
+    ]
+    for stage, values in sorted(stats.items()):
+        for bound, count in zip(LATENCY_BUCKETS, values["buckets"]):
+            lines.append(f'kaizen_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+        lines.append(f'kaizen_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {values["count"]}')
+        lines.append(f'kaizen_stage_seconds_sum{{stage="{stage}"}} {values["seconds"]:.6f}')
+        lines.append(f'kaizen_stage_seconds_count{{stage="{stage}"}} {values["count"]}')
+    lines.append("# TYPE kaizen_stage_errors_total counter")
+    for stage, values in sorted(stats.items()):
+        lines.append(f'kaizen_stage_errors_total{{stage="{stage}"}} {values["errors"]}')
+    lines.append("# TYPE kaizen_stage_bytes_total counter")
+    for stage, values in sorted(stats.items()):
+        lines.append(f'kaizen_stage_bytes_total{{stage="{stage}"}} {values["bytes"]}')
+    return "\n".join(lines) + "\n"
+
+
+# show the stages of the current rerun as a waterfall in the sidebar (developer mode only)
+def render_dev_panel(trace):
+    if not DEV_PANEL_ENABLED or trace is None:
+        return
+
+    with trace["lock"]:
+        spans = sorted(trace["spans"], key=lambda span: span["offset"])
+    total = max([span["offset"] + span["duration"] for span in spans] + [time.perf_counter() - trace["started"]])
+
+    with st.sidebar.expander("Timing (this rerun)", expanded=False):
+        if not spans:
+            st.write("No remote calls in this rerun.")
+        width = 24
+        rows = []
+        for span in spans:
+            start = int(span["offset"] / total * width) if total else 0
+            length = max(1, int(span["duration"] / total * width)) if total else 1
+            bar = " " * start + "█" * length
+            size = f" {span['bytes']}B" if span["bytes"] else ""
+            flag = f" !{span['error']}" if span["error"] else ""
+            rows.append(f"{bar:<{width}} {span['duration'] * 1000:7.1f} ms  {span['stage']}{size}{flag}")
+        rows.append(f"{'':<{width}} {total * 1000:7.1f} ms  total")
+        st.code("\n".join(rows))
+        st.code(prometheus_text())
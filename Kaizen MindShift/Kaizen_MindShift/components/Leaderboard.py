@@ -0,0 +1,101 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from boto3.dynamodb.conditions import Key
+
+from components.Answer_store import answers_table, assignment_question_key, save_high_score
+from components.Instrumentation import submit_in_context, timed_call
+
+# number of students kept on each question's leaderboard
+LEADERBOARD_SIZE = 5
+
+# seconds a leaderboard is served from memory before the GSI is read again,
+# which bounds how stale scores written by other app instances can be
+LEADERBOARD_TTL = 30
+
+_lock = threading.Lock()
+_leaderboards = {}
+
+
+# read the top scores of a question from the assignment_question_id-index GSI
+@timed_call("dynamodb.query:answers-leaderboard")
+def query_leaderboard(assignment_id, question_id):
+    response = answers_table.query(
+        IndexName="assignment_question_id-index",
+        # query only student_id and score
+        ProjectionExpression="student_id, score",
+        KeyConditionExpression=Key("assignment_question_id").eq(assignment_question_key(assignment_id, question_id)),
+        # sort by score in descending order
+        ScanIndexForward=False,
+        Limit=LEADERBOARD_SIZE,
+    )
+    return [{"student_id": item["student_id"], "score": item["score"]} for item in response["Items"]]
+
+
+def _cached(key):
+    with _lock:
+        entry = _leaderboards.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return list(entry[1])
+
+
+def _store(key, leaderboard):
+    with _lock:
+        _leaderboards[key] = (time.monotonic() + LEADERBOARD_TTL, leaderboard)
+
+
+# return the top scores of a question, served from memory while the cached copy is fresh
+def get_leaderboard(assignment_id, question_id):
+    key = assignment_question_key(assignment_id, question_id)
+    leaderboard = _cached(key)
+    if leaderboard is None:
+        leaderboard = query_leaderboard(assignment_id, question_id)
+        _store(key, leaderboard)
+    return list(leaderboard)
+
+
+# return the leaderboards of several questions of an assignment in one call,
+# querying the questions that are not cached concurrently
+def get_assignment_leaderboards(assignment_id, question_ids, max_workers=5):
+    leaderboards = {}
+    missing = []
+    for question_id in question_ids:
+        leaderboard = _cached(assignment_question_key(assignment_id, question_id))
+        if leaderboard is None:
+            missing.append(question_id)
+        else:
+            leaderboards[question_id] = leaderboard
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as executor:
+            futures = [
+                submit_in_context(executor, get_leaderboard, assignment_id, question_id) for question_id in missing
+            ]
+            for question_id, future in zip(missing, futures):
+                leaderboards[question_id] = future.result()
+
+    return {question_id: leaderboards[question_id] for question_id in question_ids}
+
+
+# fold a newly written high score into the cached leaderboard instead of re-reading the GSI
+def record_high_score(assignment_id, question_id, student_id, score):
+    key = assignment_question_key(assignment_id, question_id)
+    with _lock:
+        entry = _leaderboards.get(key)
+        if entry is None:
+            return
+        expires_at, leaderboard = entry
+        leaderboard = [record for record in leaderboard if record["student_id"] != student_id]
+        leaderboard.append({"student_id": student_id, "score": score})
+        leaderboard.sort(key=lambda record: record["score"], reverse=True)
+        _leaderboards[key] = (expires_at, leaderboard[:LEADERBOARD_SIZE])
+
+
+# store a graded answer if it is the student's best, keeping the leaderboard up to date
+def submit_score(student_id, assignment_id, question_id, answer, score):
+    if not save_high_score(student_id, assignment_id, question_id, answer, score):
+        return False
+    record_high_score(assignment_id, question_id, student_id, score)
+    return True
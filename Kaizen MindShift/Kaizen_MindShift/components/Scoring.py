@@ -0,0 +1,16 @@
+import math
+
+
+# cosine similarity of two vectors with the standard library only
+def cosine_similarity(vector_a, vector_b):
+    dot = math.fsum(a * b for a, b in zip(vector_a, vector_b))
+    norm = math.sqrt(math.fsum(a * a for a in vector_a)) * math.sqrt(math.fsum(b * b for b in vector_b))
+    if norm == 0:
+        return 0.0
+    return dot / norm
+
+
+# score an answer against its reference as 100 - cosine distance * 100
+def score_answer(reference_vector, answer_vector):
+    distance = 1 - cosine_similarity(reference_vector, answer_vector)
+    return int(100 - distance * 100)
@@ -0,0 +1,115 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from components.Bedrock_invoke import invoke_model
+from components.Bedrock_streaming import iter_json_objects
+from components.Instrumentation import submit_in_context
+
+SUGGESTION_MODEL_ID = "mistral.mistral-7b-instruct-v0:2"
+
+# number of answers whose suggestions are kept in memory
+SUGGESTION_CACHE_SIZE = 2048
+
+# shape the model must return; checked by validate_suggestions
+SUGGESTION_SCHEMA = {
+    "type": "object",
+    "required": ["corrected", "rephrased"],
+    "properties": {
+        "corrected": {"type": "string"},
+        "rephrased": {"type": "string"},
+    },
+}
+
+suggestion_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="suggestions")
+
+_lock = threading.Lock()
+_suggestion_cache = OrderedDict()
+_in_flight = {}
+
+
+def build_suggestion_prompt(text):
+    return (
+        f"{text}\n"
+        "Review the text above and return a single JSON object with two keys:\n"
+        '"corrected": the text with any grammar errors corrected, in 1 sentence.\n'
+        '"rephrased": the text improved in a way that maintains its original meaning '
+        "but uses different words and sentence structures, in 1 sentence.\n"
+        "Return only the JSON object."
+    )
+
+
+# check a parsed response against SUGGESTION_SCHEMA
+def validate_suggestions(data):
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+    for key in SUGGESTION_SCHEMA["required"]:
+        if key not in data:
+            raise ValueError(f"Missing key '{key}' in suggestions")
+    for key, rule in SUGGESTION_SCHEMA["properties"].items():
+        if rule["type"] == "string" and not isinstance(data[key], str):
+            raise ValueError(f"Key '{key}' in suggestions must be a string")
+    return {key: data[key].strip() for key in SUGGESTION_SCHEMA["properties"]}
+
+
+# take the first JSON object out of the model output and validate it
+def parse_suggestions(output_text):
+    for data in iter_json_objects([output_text]):
+        return validate_suggestions(data)
+    raise ValueError("No JSON object found in suggestions")
+
+
+# ask Mistral for the grammar correction and the rephrasing in one call
+def invoke_suggestions(text):
+    body = {
+        "prompt": build_suggestion_prompt(text),
+        "max_tokens": 400,
+        "temperature": 0,
+        "top_p": 0.7,
+        "top_k": 50
+    }
+
+    response_body = invoke_model(SUGGESTION_MODEL_ID, body)
+    outputs = response_body.get('outputs')
+    return parse_suggestions("".join(output['text'] for output in outputs))
+
+
+def _remember(text, suggestions):
+    with _lock:
+        _suggestion_cache[text] = suggestions
+        _suggestion_cache.move_to_end(text)
+        while len(_suggestion_cache) > SUGGESTION_CACHE_SIZE:
+            _suggestion_cache.popitem(last=False)
+        _in_flight.pop(text, None)
+
+
+def _compute(text):
+    try:
+        suggestions = invoke_suggestions(text)
+    except Exception:
+        with _lock:
+            _in_flight.pop(text, None)
+        raise
+    _remember(text, suggestions)
+    return suggestions
+
+
+# start generating suggestions in the background and return a Future with the result;
+# cached answers resolve immediately and identical in-flight answers share one call
+def request_suggestions(text):
+    with _lock:
+        suggestions = _suggestion_cache.get(text)
+        if suggestions is not None:
+            _suggestion_cache.move_to_end(text)
+            future = Future()
+            future.set_result(suggestions)
+            return future
+        future = _in_flight.get(text)
+        if future is None:
+            future = submit_in_context(suggestion_executor, _compute, text)
+            _in_flight[text] = future
+        return future
+
+
+def get_suggestions(text):
+    return request_suggestions(text).result()
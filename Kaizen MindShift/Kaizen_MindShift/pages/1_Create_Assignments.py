@@ -1,35 +1,48 @@
-import json, logging, math, random, time, base64
-from io import BytesIO
+import json, logging, math, queue, random, time, base64
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
 
-import boto3, numpy as np, streamlit as st
-from PIL import Image
-from botocore.exceptions import ClientError
-from components.Parameter_store import S3_BUCKET_NAME
+import streamlit as st
+from components.Assignment_store import save_assignment
+from components.Bulk_authoring import BULK_MAX_WORKERS, author_rows, parse_source_file
+from components.Bedrock_invoke import invoke_model
+from components.Image_store import upload_image_variants
+from components.Embedding_cache import EMBEDDING_MODEL_ID, encode_embedding, get_text_embeds
+from components.Generation_cache import get_or_generate
+from components.Bedrock_streaming import iter_json_objects, stream_model_text
+from components.Instrumentation import render_dev_panel, start_trace, submit_in_context
 
 
 # Set up logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-dynamodb_client = boto3.resource("dynamodb")
-bedrock_client = boto3.client("bedrock-runtime")
-questions_table = dynamodb_client.Table("assignments")
 user_name = "CloudAge-User"
 
 text_model_id = "amazon.nova-pro-v1:0"
 image_model_id = "amazon.nova-canvas-v1:0"
 
+# seconds to wait for each generation call before giving up on it
+questions_timeout = 60
+image_timeout = 90
+
+# how often the page checks for streamed questions while the model calls run
+generation_poll_interval = 0.2
+
 if "input-text" not in st.session_state:
     st.session_state["input-text"] = None
 
 if "question_answers" not in st.session_state:
     st.session_state["question_answers"] = None
 
+if "image_bytes" not in st.session_state:
+    st.session_state["image_bytes"] = None
+
 if "reading_material" not in st.session_state:
     st.session_state["reading_material"] = None
 
 # Method to call the foundation model 
-def query_generate_questions_answers_endpoint(input_text):
+def query_generate_questions_answers_endpoint(input_text, refresh=False, on_question=None):
     prompt = f"{input_text}\n Using the above context, please generate five questions and answers you could ask students about this information."
     prompt = prompt + "\nFormat the output as a list of five JSON objects containing the keys: Id, Question, and Answer"
     input_data = {
@@ -43,57 +56,74 @@ def query_generate_questions_answers_endpoint(input_text):
             }
         ]
     }
-    try:
-        qa_response = bedrock_client.invoke_model(
-            modelId=text_model_id,
-            body=json.dumps(input_data).encode("utf-8"),
-            accept='application/json',
-            contentType='application/json'
-        )
-    except (ClientError, Exception) as e:
-        print(f"ERROR: Can't invoke '{text_model_id}'. Reason: {e}")
-        exit(1)
-    
-    response_body = json.loads(qa_response.get("body").read().decode())
+    return get_or_generate(
+        text_model_id,
+        prompt,
+        lambda: invoke_generate_questions_answers(input_data, on_question),
+        inference_config=input_data["inferenceConfig"],
+        refresh=refresh,
+    )
+
+
+def invoke_generate_questions_answers(input_data, on_question=None):
+    if on_question is not None:
+        return stream_generate_questions_answers(input_data, on_question)
+
+    # errors propagate to the page instead of stopping the whole process
+    response_body = invoke_model(text_model_id, input_data)
     response_text = response_body['output']['message']['content'][0]['text']
 
     return parse_text_to_lines(response_text)
 
+# stream the completion, handing each question/answer to on_question as soon as its object is complete
+def stream_generate_questions_answers(input_data, on_question):
+    chunks = []
+
+    def collect_chunks():
+        for chunk in stream_model_text(text_model_id, input_data):
+            chunks.append(chunk)
+            yield chunk
+
+    for question_answer in iter_json_objects(collect_chunks()):
+        on_question(question_answer)
+
+    return parse_text_to_lines("".join(chunks))
+
 # method to call the Titan image foundation model
-def query_generate_image_endpoint(input_text):
-    seed = np.random.randint(1000)
-    input_body = json.dumps({
+def query_generate_image_endpoint(input_text, seed=0, refresh=False):
+    image_generation_config = {
+        "numberOfImages": 1,
+        "height": 1024,
+        "width": 1024,
+        "cfgScale": 8.0,
+        "seed": seed
+    }
+    input_body = {
         "taskType": "TEXT_IMAGE",
         "textToImageParams": {
             "text": f"An image of {input_text}"
         },
-        "imageGenerationConfig": {
-            "numberOfImages": 1,
-            "height": 1024,
-            "width": 1024,
-            "cfgScale": 8.0,
-            "seed": 0
-        }
-    })
+        "imageGenerationConfig": image_generation_config
+    }
     if image_model_id == "<model-id>":
         return None
     else:
-        titan_image_api_response = bedrock_client.invoke_model(
-            body=input_body,
-            modelId=image_model_id,
-            accept="application/json",
-            contentType="application/json",
+        return get_or_generate(
+            image_model_id,
+            f"An image of {input_text}",
+            lambda: invoke_generate_image(input_body),
+            inference_config=image_generation_config,
+            seed=seed,
+            refresh=refresh,
         )
-        response_body = json.loads(
-            titan_image_api_response.get("body").read()
-        )
-            
-        base64_image = response_body.get("images")[0]
-        base64_bytes = base64_image.encode('ascii')
-        image_bytes = base64.b64decode(base64_bytes)
-        
-        image = Image.open(BytesIO(image_bytes))
-        return image
+
+
+def invoke_generate_image(input_body):
+    response_body = invoke_model(image_model_id, input_body)
+
+    base64_image = response_body.get("images")[0]
+    base64_bytes = base64_image.encode('ascii')
+    return base64.b64decode(base64_bytes)
 
 def generate_assignment_id_key():
     # Milliseconds since epoch
@@ -103,32 +133,103 @@ def generate_assignment_id_key():
     return (epoch * 1000) + rand_id
 
 
-# create a function to load a file to S3 bucket
-def load_file_to_s3(file_name, object_name):
-    # Upload the file
-    s3_client = boto3.client("s3")
-    try:
-        s3_client.upload_file(file_name, S3_BUCKET_NAME, object_name)
-    except ClientError as e:
-        logging.error(e)
-        return False
-    return True
+# build the DynamoDB record of an assignment
+def build_assignment_item(
+    assignment_id, prompt, s3_image_name, data, answer_embeddings=None, image_variants=None
+):
+    item = {
+        "assignment_id": assignment_id,
+        "teacher_id": user_name,
+        "prompt": prompt,
+        "s3_image_name": s3_image_name,
+        "question_answers": data,
+    }
+    if image_variants:
+        item["image_variants"] = image_variants
+    if answer_embeddings:
+        item["answer_embeddings"] = answer_embeddings
+        item["embedding_model_id"] = EMBEDDING_MODEL_ID
+    return item
 
 
 # create a function to insert a record to DynamoDB table created_images
 def insert_record_to_dynamodb(
-    assignment_id, prompt, s3_image_name, data
+    assignment_id, prompt, s3_image_name, data, answer_embeddings=None, image_variants=None
 ):
-    questions_table.put_item(
-        Item={
-            "assignment_id": assignment_id,
-            "teacher_id": user_name,
-            "prompt": prompt,
-            "s3_image_name": s3_image_name,
-            "question_answers": data,
-        }
+    save_assignment(build_assignment_item(
+        assignment_id, prompt, s3_image_name, data, answer_embeddings, image_variants
+    ))
+
+
+# distinct assignment ids for a bulk run, since rows authored in the same millisecond could collide
+def generate_assignment_ids(count):
+    assignment_ids = []
+    while len(assignment_ids) < count:
+        assignment_id = str(generate_assignment_id_key())
+        if assignment_id not in assignment_ids:
+            assignment_ids.append(assignment_id)
+    return assignment_ids
+
+
+# generate, upload and embed one bulk row, reporting each step; the record is saved by author_rows
+def author_assignment(row, report):
+    assignment_id, text = row
+    report("generating questions")
+    question_answers = query_generate_questions_answers_endpoint(text)
+
+    object_name = "no image created"
+    image_variants = None
+    if image_model_id != "<model-id>":
+        report("generating image")
+        image_bytes = query_generate_image_endpoint(text)
+        if image_bytes:
+            report("uploading image")
+            image_variants = upload_image_variants(assignment_id, image_bytes)
+            object_name = image_variants.pop("original")
+
+    report("embedding answers")
+    answer_embeddings = embed_reference_answers(question_answers)
+    return build_assignment_item(
+        assignment_id, text, object_name, json.dumps(question_answers, indent=4), answer_embeddings, image_variants
     )
 
+
+# author every sentence of an uploaded file, showing the status of each row as it changes
+def run_bulk_authoring(texts, max_workers):
+    rows = list(zip(generate_assignment_ids(len(texts)), texts))
+    statuses = [
+        {"Assignment ID": assignment_id, "Text": text, "Status": "queued"} for assignment_id, text in rows
+    ]
+    progress = st.progress(0.0)
+    table = st.empty()
+    table.table(statuses)
+
+    completed = 0
+    for index, status, detail in author_rows(rows, author_assignment, max_workers=max_workers):
+        if status == "failed":
+            statuses[index]["Status"] = f"failed: {detail}"
+        else:
+            statuses[index]["Status"] = status
+        if status in ("saved", "failed"):
+            completed += 1
+            progress.progress(completed / len(rows))
+        table.table(statuses)
+
+    failed = sum(1 for row_status in statuses if row_status["Status"].startswith("failed"))
+    if failed:
+        st.warning(f"Created {len(rows) - failed} of {len(rows)} assignments; {failed} rows failed.")
+    else:
+        st.success(f"Created {len(rows)} assignments.")
+
+
+# embed all reference answers in one batch, keyed by question Id as compact float16 strings
+def embed_reference_answers(question_answers):
+    vectors = get_text_embeds([question_answer["Answer"] for question_answer in question_answers])
+    return {
+        str(question_answer["Id"]): encode_embedding(vector)
+        for question_answer, vector in zip(question_answers, vectors)
+    }
+
 # Parse a string of text into a JSON dictionary object
 def parse_text_to_lines(text):
     text = text.replace("```json\n", "").replace("\n```", "")
@@ -138,30 +239,117 @@ def parse_text_to_lines(text):
 
     return data
 
+# Show a result as soon as its model call finishes
+def render_generation_result(placeholder, name, result):
+    if name == "image_bytes":
+        placeholder.image(result, width=512)
+    else:
+        placeholder.json(result)
+
+
+# Run the question and image model calls concurrently, rendering whichever finishes first
+def generate_assignment_content(input_text):
+    streamed_questions = queue.Queue()
+    jobs = {
+        "question_answers": (
+            partial(query_generate_questions_answers_endpoint, on_question=streamed_questions.put),
+            questions_timeout,
+        )
+    }
+    if image_model_id != "<model-id>":
+        jobs["image_bytes"] = (query_generate_image_endpoint, image_timeout)
+
+    placeholders = {name: st.empty() for name in jobs}
+    for name, placeholder in placeholders.items():
+        # never keep results that belong to the previous input text
+        st.session_state[name] = None
+        placeholder.info("Generating...")
+
+    executor = ThreadPoolExecutor(max_workers=len(jobs))
+    started = time.monotonic()
+    futures = {submit_in_context(executor, generate, input_text): name for name, (generate, _) in jobs.items()}
+    pending = set(futures)
+    completed = []
+    partial_questions = []
+    try:
+        while pending:
+            elapsed = time.monotonic() - started
+            remaining = min(jobs[futures[future]][1] for future in pending) - elapsed
+            done, pending = wait(
+                pending, timeout=min(max(remaining, 0), generation_poll_interval), return_when=FIRST_COMPLETED
+            )
+
+            # show each streamed question/answer pair while the rest is still generating
+            streamed = False
+            while not streamed_questions.empty():
+                partial_questions.append(streamed_questions.get_nowait())
+                streamed = True
+            if streamed and st.session_state["question_answers"] is None:
+                placeholders["question_answers"].json(partial_questions)
+
+            for future in done:
+                name = futures[future]
+                try:
+                    st.session_state[name] = future.result()
+                    render_generation_result(placeholders[name], name, st.session_state[name])
+                    completed.append(name)
+                except Exception as ex:
+                    placeholders[name].error(f"There was an error while generating {name}. {ex}")
+
+            # drop the calls that ran past their own timeout
+            elapsed = time.monotonic() - started
+            for future in [future for future in pending if jobs[futures[future]][1] <= elapsed]:
+                future.cancel()
+                pending.discard(future)
+                placeholders[futures[future]].warning(f"Timed out while generating {futures[future]}.")
+    finally:
+        executor.shutdown(wait=False)
+
+    # the sections below render the finished results, so clear the partial previews
+    for name in completed:
+        placeholders[name].empty()
+
+
 # Page configuration
 st.set_page_config(page_title="Create Assignments", page_icon=":pencil:", layout="wide")
+trace = start_trace("Create Assignments")
 
 # Sidebar
 st.sidebar.header("Create Assignments")
 
 # Rest of the page
 st.markdown("# Create Assignments")
+authoring_mode = st.sidebar.radio("Authoring mode", ["Single assignment", "Bulk authoring"])
+
+if authoring_mode == "Bulk authoring":
+    st.sidebar.header("Upload sentences to create assignments")
+    source_file = st.file_uploader(
+        "CSV with a 'text' column, or JSONL with one sentence or {\"text\": ...} per line",
+        type=["csv", "jsonl", "ndjson"],
+    )
+    max_workers = st.sidebar.number_input("Parallel rows", min_value=1, max_value=16, value=BULK_MAX_WORKERS)
+    if source_file is not None:
+        try:
+            source_texts = parse_source_file(source_file.name, source_file.getvalue())
+        except ValueError as ex:
+            st.error(f"Could not read {source_file.name}. {ex}")
+            source_texts = []
+        st.write(f"{len(source_texts)} sentences found.")
+        if source_texts and st.button("Create Assignments"):
+            try:
+                run_bulk_authoring(source_texts, int(max_workers))
+            except Exception as ex:
+                st.error(f"Error saving assignments: {ex}")
+    render_dev_panel(trace)
+    st.stop()
+
 st.sidebar.header("Input text to create assignments")
 
 text = st.text_area("Input Text")
 if text and text != st.session_state.get("input-text", None) and text != "None":
-    try:
-        if image_model_id != "<model-id>":
-            image = query_generate_image_endpoint(text)
-            image.save("temp-create.png")
-            st.session_state["input-text"] = text
-
-        # generate questions and answer
-        questions_answers = query_generate_questions_answers_endpoint(text)
-        # st.write(questions_answers)
-        st.session_state["question_answers"] = questions_answers
-    except Exception as ex:
-        st.error(f"There was an error while generating question. {ex}")
+    # generate the image and the questions and answers at the same time
+    st.session_state["input-text"] = text
+    generate_assignment_content(text)
 
 if st.session_state.get("question_answers", None):
     st.markdown("## Generated Questions and Answers")
@@ -173,18 +361,23 @@ if st.session_state.get("question_answers", None):
     )
 
 if st.button("Generate Questions and Answers"):
-    st.session_state["question_answers"] = query_generate_questions_answers_endpoint(text)
-    st.experimental_rerun()
+    try:
+        # explicit regeneration skips the cached result
+        st.session_state["question_answers"] = query_generate_questions_answers_endpoint(text, refresh=True)
+        st.experimental_rerun()
+    except Exception as ex:
+        st.error(f"There was an error while generating question. {ex}")
 
 if st.session_state.get("input-text", None):
-    if image_model_id != "<model-id>":
-        images = Image.open("temp-create.png")
-        st.image(images, width=512)
+    if image_model_id != "<model-id>" and st.session_state.get("image_bytes", None):
+        st.image(st.session_state["image_bytes"], width=512)
 
 if image_model_id != "<model-id>":
     if st.button("Generate New Image"):
-        image = query_generate_image_endpoint(text)
-        image.save("temp-create.png")
+        # a fresh seed gives a different image, and refresh skips the cached one
+        st.session_state["image_bytes"] = query_generate_image_endpoint(
+            text, seed=random.randint(0, 2147483646), refresh=True
+        )
         st.experimental_rerun()
 
 st.markdown("------------")
@@ -200,16 +393,13 @@ if st.button("Save Question"):
             assignment_id = str(generate_assignment_id_key())
             questions_answers = json.dumps(st.session_state["question_answers"], indent=4)
             
+            image_variants = None
             if image_model_id != "<model-id>":
                 # Image creation path
-                object_name = f"generated_images/{assignment_id}.png"
-                validation_object_name = f"generated_images/temp-create.png"
-                
-                # Check if temp image exists before uploading
-                import os
-                if os.path.exists("temp-create.png"):
-                    load_file_to_s3("temp-create.png", object_name)
-                    load_file_to_s3("temp-create.png", validation_object_name)
+                if st.session_state.get("image_bytes", None):
+                    # Upload the original and its WebP derivatives in parallel
+                    image_variants = upload_image_variants(assignment_id, st.session_state["image_bytes"])
+                    object_name = image_variants.pop("original")
                     st.success(f"Image generated and uploaded successfully: {object_name}")
                 else:
                     st.warning("No image found to upload. Proceeding without image.")
@@ -218,9 +408,16 @@ if st.button("Save Question"):
                 # No image creation path
                 object_name = "no image created"
             
+            # Embed the reference answers once so grading only embeds the student's text
+            answer_embeddings = embed_reference_answers(st.session_state["question_answers"])
+
             # Insert record to DynamoDB
-            insert_record_to_dynamodb(assignment_id, text, object_name, questions_answers)
+            insert_record_to_dynamodb(
+                assignment_id, text, object_name, questions_answers, answer_embeddings, image_variants
+            )
             st.success(f"Assignment created and saved successfully with ID: {assignment_id}")
             
         except Exception as ex:
             st.error(f"Error saving assignment: {ex}")
+
+render_dev_panel(trace)
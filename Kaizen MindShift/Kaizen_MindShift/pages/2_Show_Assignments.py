@@ -1,54 +1,29 @@
-import logging
 import streamlit as st
-from PIL import Image
-from botocore.exceptions import ClientError
-import boto3
-from components.Parameter_store import S3_BUCKET_NAME
-
-assignments_table_name = "assignments"
-dynamodb = boto3.resource("dynamodb")
-assignments_table = dynamodb.Table(assignments_table_name)
-
-
-# create a function to retrieve records from DynamoDB table and return a list of records
-def get_records_from_dynamodb():
-    response = assignments_table.scan()
-    return response["Items"]
-
-
-#  create a function to download images from s3 bucket
-def download_image(image_name, file_name):
-    s3 = boto3.client("s3")
-    try:
-        s3.download_file(S3_BUCKET_NAME, image_name, file_name)
-        return True
-    except ClientError as e:
-        logging.error(e)
-        return False
+from components.Image_store import THUMBNAIL_WIDTH, get_display_image
+from components.Assignment_store import get_assignment, load_assignment_index
+from components.Instrumentation import render_dev_panel, start_trace
 
 
 # Page configuration
 st.set_page_config(page_title="Show Assignment",  page_icon=":bar_chart:", layout="wide")
+trace = start_trace("Show Assignments")
 
 # Rest of the page
 st.markdown("# Selected Assignment")
 st.sidebar.header("Show Assignments")
 
 # add a list of prompts from DynamoDB
-db_records = get_records_from_dynamodb()
-prompts = [record["assignment_id"] for record in db_records]
+assignment_index = load_assignment_index()
+prompts = list(assignment_index)
 
 prompt_option = st.sidebar.selectbox("Select an assignment", prompts)
 
 if prompt_option:
-    for record in db_records:
-        if record["assignment_id"] == prompt_option:
-            prompt_selection = record
+    prompt_selection = get_assignment(prompt_option)
 
-    image_name = prompt_selection["s3_image_name"]
-    file_name = "temp-show.png"
-    if download_image(image_name, file_name):
-        st.image(Image.open(file_name), width=128)
+    thumbnail = get_display_image(prompt_selection)
+    if thumbnail:
+        st.image(thumbnail, width=THUMBNAIL_WIDTH)
     else:
         st.write("Image not found")
 
@@ -63,3 +38,4 @@ hide_streamlit_style = """
     """
 
 st.markdown(hide_streamlit_style, unsafe_allow_html=True)
+render_dev_panel(trace)
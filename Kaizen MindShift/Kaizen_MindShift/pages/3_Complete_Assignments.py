@@ -1,149 +1,40 @@
-import json
-import logging
-import requests
 import streamlit as st
-import numpy as np
-from PIL import Image
-from boto3.dynamodb.conditions import Key
-from botocore.exceptions import ClientError
-import boto3
-from scipy.spatial import distance
-from components.Parameter_store import S3_BUCKET_NAME
+from components.Image_store import THUMBNAIL_WIDTH, get_display_image
+from components.Assignment_store import get_assignment, get_question_index, load_assignment_index
+from components.Embedding_cache import EMBEDDING_MODEL_ID, decode_embedding, get_text_embed
+from components.Leaderboard import LEADERBOARD_SIZE, get_leaderboard, submit_score
+from components.Grading import cached_stage, grading_key, grading_memo
+from components.Scoring import score_answer
+from components.Suggestions import request_suggestions
+from components.Instrumentation import render_dev_panel, start_trace
 
 answer = None
 show_prompt = None
 prompt = None
 
-bedrock_client = boto3.client("bedrock-runtime")
-dynamodb = boto3.resource("dynamodb")
-assignments_table = dynamodb.Table("assignments")
-answers_table = dynamodb.Table("answers")
 user_name = "CloudAge-User"
 
 
-# create a function to retrieve records from DynamoDB table and return a list of records
-def get_assignments_from_dynamodb():
-    response = assignments_table.scan()
-    return response["Items"]
-
-
-#  create a function to download images from s3 bucket
-def download_image(image_name, file_name):
-    s3 = boto3.client("s3")
-    try:
-        s3.download_file(S3_BUCKET_NAME, image_name, file_name)
-        return True
-    except ClientError as e:
-        logging.error(e)
-        return False
-
-
-# function to query a dynamoDB table for a specific key
-def get_answer_record_from_dynamodb(student_id, assignment_id, question_id):
-    response = answers_table.get_item(
-        Key={"student_id": student_id, "assignment_question_id": assignment_id + "_" + str(question_id)}
-    )
-    return response["Item"]
-
-
-def get_text_embed(payload):
-    input_body = {
-        "inputText": payload,
-    }
-    api_response = bedrock_client.invoke_model(
-        body=json.dumps(input_body),
-        modelId="amazon.titan-embed-text-v2:0",
-        accept="application/json",
-        contentType="application/json",
-    )
-    embedding_response = json.loads(
-        api_response.get("body").read().decode('utf-8')
-    )
-    embedding_array = list(embedding_response['embedding'])
-    return embedding_array
-
-
-# function to query the top five scores for a specific image_id
-def get_high_score_answer_records_from_dynamodb(assignment_id, question_id):
-    response = answers_table.query(
-        IndexName="assignment_question_id-index",
-        # query only student_id and score
-        ProjectionExpression="student_id, score",
-        KeyConditionExpression=Key("assignment_question_id").eq(assignment_id + "_" + str(question_id)),
-        # sort by score in descending order
-        ScanIndexForward=False,
-        Limit=5,
-    )
-    return response["Items"]
-
-
-def generate_suggestions_sentence_improvements(text):
-    # demonstrate usig Mistral to rephrase the student's answer 
-    model_id = 'mistral.mistral-7b-instruct-v0:2'
-
-    input_text = f"""{text}\nImprove the text above in a way that maintains its original meaning but uses different words and sentence structures. Keep your response in 1 sentence."""
-
-    body = json.dumps({
-        "prompt": input_text,
-        "max_tokens": 400,
-        "temperature": 0,
-        "top_p": 0.7,
-        "top_k": 50
-    })
-
-    response = bedrock_client.invoke_model(
-        body=body,
-        modelId=model_id
-    )
-    response_body = json.loads(response.get('body').read())
-    outputs = response_body.get('outputs')
-
-    output_text = ""
-    for index, output in enumerate(outputs):
-        output_text = f"{output_text}\n{output['text']}"
-        
-    return output_text
-
-
-
-def generate_suggestions_word_improvements(text):
-    #demonstrate using Mistral to correct grammar error
-    model_id = 'mistral.mistral-7b-instruct-v0:2'
-
-    input_text = f"""{text}\nReview the text above and correct any grammar errors. Keep your response in 1 sentence."""
-
-    body = json.dumps({
-        "prompt": input_text,
-        "max_tokens": 400,
-        "temperature": 0,
-        "top_p": 0.7,
-        "top_k": 50
-    })
-
-    response = bedrock_client.invoke_model(
-        body=body,
-        modelId=model_id
-    )
-    response_body = json.loads(response.get('body').read())
-    outputs = response_body.get('outputs')
-
-    output_text = ""
-    for index, output in enumerate(outputs):
-        output_text = f"{output_text}\n{output['text']}"
-        
-    return output_text
+# use the reference embedding stored with the assignment, embedding the answer only for older records
+def get_reference_embed(assignment_record, question_id, correct_answer):
+    answer_embeddings = assignment_record.get("answer_embeddings") or {}
+    encoded = answer_embeddings.get(str(question_id))
+    if encoded and assignment_record.get("embedding_model_id") == EMBEDDING_MODEL_ID:
+        return decode_embedding(encoded)
+    return get_text_embed(correct_answer)
 
 
 st.set_page_config(page_title="Answer Questions",  page_icon=":question:", layout="wide")
+trace = start_trace("Complete Assignments")
 
 # Rest of the page
 st.markdown("# Answer Questions")
 st.sidebar.header("Answer Questions")
 
 # add a list of prompts from DynamoDB
-assignment_records = get_assignments_from_dynamodb()
-# create a list from the dictionary by prompt
-assignment_ids = [record["assignment_id"] for record in assignment_records]
+assignment_index = load_assignment_index()
+# create a list of the assignment ids
+assignment_ids = list(assignment_index)
 # insert an element at assignment_ids[0]
 assignment_ids.insert(0, "<Select>")
 
@@ -151,28 +42,24 @@ assignment_id_selection = st.sidebar.selectbox("Select an assignment", assignmen
 assignment_selection = None
 
 if assignment_id_selection and assignment_id_selection != "<Select>":
-    # Find the db record with the prompt
-    for assignment_record in assignment_records:
-        if assignment_record["assignment_id"] == assignment_id_selection:
-            assignment_selection = assignment_record
+    # Fetch the full record only for the selected assignment
+    assignment_selection = get_assignment(assignment_id_selection)
 
 if assignment_selection:
     # Show the image
-    image_name = assignment_selection["s3_image_name"]
-    file_name = "temp-answer.png"
-    if download_image(image_name, file_name):
-        st.image(Image.open(file_name), width=128)
+    thumbnail = get_display_image(assignment_selection)
+    if thumbnail:
+        st.image(thumbnail, width=THUMBNAIL_WIDTH)
 
     # Show the prompt
     st.write(assignment_selection["prompt"])
 
     # Select a question
-    question_answers_text = assignment_selection["question_answers"]
-    question_answers = json.loads(question_answers_text)
-
-    questions = [question_answer["Question"] for question_answer in question_answers]
-    generate_question_selection = st.selectbox(
-        "Select a question", questions
+    question_index = get_question_index(assignment_id_selection)
+    question_id_selection = st.selectbox(
+        "Select a question",
+        list(question_index),
+        format_func=lambda question_key: question_index[question_key]["Question"],
     )
 
     answer = st.text_input(
@@ -180,67 +67,66 @@ if assignment_selection:
         key="prompt",
     )
 
-    # find answer in the question_answers based on the selected question
+    # look up the selected question by its Id
     correct_answer = None
     question_id = None
-    for question_answer in question_answers:
-        if question_answer["Question"] == generate_question_selection:
-            correct_answer = question_answer["Answer"]
-            question_id = question_answer["Id"]
-            break
+    if question_id_selection in question_index:
+        correct_answer = question_index[question_id_selection]["Answer"]
+        question_id = question_index[question_id_selection]["Id"]
 
     if answer and correct_answer:
         st.write("Your guess: ", answer)
-        v1 = np.squeeze(np.array(get_text_embed(correct_answer)))
-        v2 = np.squeeze(np.array(get_text_embed(answer)))
-        dist = distance.cosine(v1, v2)
-        score = int(100 - dist * 100)
+        # every stage below runs once per (student, assignment, question, answer);
+        # reruns from other widgets reuse the remembered results
+        memo = grading_memo(
+            st.session_state, grading_key(user_name, assignment_id_selection, question_id, answer)
+        )
+
+        # start the suggestions in the background so the score shows straight away
+        suggestions_future = cached_stage(memo, "suggestions", lambda: request_suggestions(answer))
+
+        score = cached_stage(memo, "score", lambda: score_answer(
+            get_reference_embed(assignment_selection, question_id, correct_answer),
+            get_text_embed(answer),
+        ))
         # show the result
         st.write(f"Your answer has a score of {score}")
 
         st.markdown("------------")
 
-        try:
-            db_record = get_answer_record_from_dynamodb(
-                user_name, assignment_id_selection, question_id
-            )
-            if db_record["score"] < score:
-                db_record["score"] = score
-                db_record["answer"] = answer
-                answers_table.put_item(Item=db_record)
-                st.write(
-                    f"Your highest score has been updated. Your new score is {score}"
-                    f" and your new answer is '{answer}'."
-                )
-        except KeyError:
-            db_record = {
-                "student_id": user_name,
-                "assignment_question_id": assignment_id_selection + "_" + str(question_id),
-                "answer": answer,
-                "score": score,
-            }
-            answers_table.put_item(Item=db_record)
+        high_score_updated = cached_stage(memo, "high_score_updated", lambda: submit_score(
+            user_name, assignment_id_selection, question_id, answer, score
+        ))
+        if high_score_updated:
             st.write(
                 f"Your highest score has been updated. Your new score is {score}"
                 f" and your new answer is '{answer}'."
             )
 
-        # Query top five scores for the image
-        high_score_records = get_high_score_answer_records_from_dynamodb(
+        # Top scores for the question, served from the in-process leaderboard
+        high_score_records = cached_stage(memo, "high_scores", lambda: get_leaderboard(
             assignment_id_selection, question_id
-        )
+        ))
         # show the high score records
-        st.write("Top Three High Scores: ")
+        st.write(f"Top {LEADERBOARD_SIZE} High Scores: ")
         for record in high_score_records:
             st.write(f"Student ID: {record['student_id']} - Score: {record['score']}")
 
         # Suggested improvements for the answer
         st.markdown("------------")
         st.markdown("Suggested corrections: ")
-        st.write(generate_suggestions_word_improvements(answer))
-
+        corrections_placeholder = st.empty()
         st.markdown("Suggested sentences: ")
-        st.write(generate_suggestions_sentence_improvements(answer))
+        sentences_placeholder = st.empty()
+        try:
+            with st.spinner("Generating suggestions..."):
+                suggestions = suggestions_future.result()
+            corrections_placeholder.write(suggestions["corrected"])
+            sentences_placeholder.write(suggestions["rephrased"])
+        except Exception as ex:
+            # forget the failed call so the next rerun tries again
+            memo.pop("suggestions", None)
+            corrections_placeholder.warning(f"Suggestions are not available right now. {ex}")
 
         if st.button("Show the correct answer"):
             st.write("Answer: ")
@@ -258,3 +144,4 @@ hide_streamlit_style = """
     """
 
 st.markdown(hide_streamlit_style, unsafe_allow_html=True)
+render_dev_panel(trace)
@@ -5,15 +5,60 @@ Single file, no external dependencies, production-ready
 Works on any Linux system including Ubuntu 22.04
 """
 
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+from http import HTTPStatus
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+import asyncio
 import sys
 import signal
 import socket
-from functools import partial
-from urllib.request import urlopen
+import threading
+import time
+import gzip
+import hashlib
+import html
+import queue
+import random
+from functools import lru_cache, partial
+from urllib.request import Request, urlopen
 from urllib.error import URLError
 import json
 
+try:
+    import brotli  # Optional: adds a br variant to the response cache when installed
+except ImportError:
+    brotli = None
+
+# Serving modes selectable with --mode
+SERVER_MODES = ('single', 'threaded', 'async')
+
+# Access log formats selectable with --log_format
+LOG_FORMATS = ('text', 'json')
+
+# Headers sent with every dynamically rendered HTML page
+NO_CACHE_HEADERS = (
+    ('Cache-Control', 'no-cache, no-store, must-revalidate'),
+    ('Pragma', 'no-cache'),
+    ('Expires', '0'),
+)
+
+# Routes whose pages only change with the metadata snapshot, so they are rendered ahead of time
+CACHED_ROUTES = ('/', '/healthcheck', '/info')
+
+# Preferred order of the precompressed variants
+ENCODING_PREFERENCE = ('br', 'gzip')
+
+# Load balancer probe paths; their access logs are sampled with --probe_log_rate
+PROBE_PATHS = frozenset(('/livez', '/readyz', '/healthcheck'))
+
+# Fixed probe responses, sent without touching the page template
+PROBE_HEADERS = (('Content-type', 'text/plain; charset=utf-8'), ('Cache-Control', 'no-store'))
+LIVE_RESPONSE = (200, PROBE_HEADERS + (('Content-Length', '3'),), b'ok\n')
+READY_RESPONSE = (200, PROBE_HEADERS + (('Content-Length', '6'),), b'ready\n')
+NOT_READY_RESPONSE = (503, PROBE_HEADERS + (('Content-Length', '10'),), b'not ready\n')
+DRAINING_RESPONSE = (503, PROBE_HEADERS + (('Content-Length', '9'),), b'draining\n')
+
 # HTML template
 HTML_TEMPLATE = """<!DOCTYPE html>
 <html>
@@ -42,225 +87,717 @@ HTML_TEMPLATE = """<!DOCTYPE html>
 </html>"""
 
 
+class MetadataSnapshot:
+    """Immutable copy of the EC2 metadata the pages show, shared by all request threads"""
+    
+    __slots__ = (
+        'available', 'instance_id', 'instance_type', 'availability_zone',
+        'private_ipv4', 'public_ipv4', 'region', 'fetched_at'
+    )
+    
+    def __init__(self, available, values=None):
+        values = values or {}
+        object.__setattr__(self, 'available', available)
+        for name in ('instance_id', 'instance_type', 'availability_zone', 'private_ipv4', 'public_ipv4'):
+            object.__setattr__(self, name, values.get(name) or "N/A")
+        az = self.availability_zone
+        # Remove last character (zone letter)
+        object.__setattr__(self, 'region', az[:-1] if az != "N/A" else None)
+        object.__setattr__(self, 'fetched_at', time.time())
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("MetadataSnapshot is immutable")
+    
+    def __delattr__(self, name):
+        raise AttributeError("MetadataSnapshot is immutable")
+
+
 class EC2Metadata:
-    """Fallback-safe EC2 metadata retriever using IMDSv2"""
+    """Fallback-safe EC2 metadata retriever using IMDSv2, read once into a MetadataSnapshot"""
     
     METADATA_URL = "http://169.254.169.254/latest/meta-data/"
     TOKEN_URL = "http://169.254.169.254/latest/api/token"
-    TOKEN_TTL = "21600"
+    TOKEN_TTL = 21600
+    TOKEN_RENEW_MARGIN = 60  # Renew the token this many seconds before it expires
     TIMEOUT = 1  # Quick timeout for non-EC2 environments
     
+    # Snapshot attribute -> metadata path
+    PATHS = {
+        'instance_id': "instance-id",
+        'instance_type': "instance-type",
+        'availability_zone': "placement/availability-zone",
+        'private_ipv4': "local-ipv4",
+        'public_ipv4': "public-ipv4",
+    }
+    
     def __init__(self):
         self.token = None
-        self.available = self._check_availability()
+        self.token_expires = 0.0
+        self.token_lock = threading.Lock()
+        self.refresh_thread = None
+        self.snapshot = self.fetch_snapshot()
     
-    def _check_availability(self):
-        """Check if running on EC2 by attempting to get token"""
-        try:
-            req = urlopen(
-                self.TOKEN_URL,
-                data=None,
-                timeout=self.TIMEOUT
-            )
-            req.close()
-            return True
-        except (URLError, socket.timeout, OSError):
-            return False
+    @property
+    def available(self):
+        return self.snapshot.available
     
     def _get_token(self):
-        """Get IMDSv2 token"""
-        if self.token:
-            return self.token
-        
+        """Get an IMDSv2 token, renewing it shortly before its TTL runs out"""
+        with self.token_lock:
+            if self.token and time.monotonic() < self.token_expires:
+                return self.token
+            
+            try:
+                req = urlopen(
+                    Request(
+                        self.TOKEN_URL,
+                        method='PUT',
+                        headers={'X-aws-ec2-metadata-token-ttl-seconds': str(self.TOKEN_TTL)}
+                    ),
+                    timeout=self.TIMEOUT
+                )
+                self.token = req.read().decode('utf-8')
+                self.token_expires = time.monotonic() + self.TOKEN_TTL - self.TOKEN_RENEW_MARGIN
+                return self.token
+            except (URLError, socket.timeout, OSError):
+                self.token = None
+                return None
+    
+    def _get_metadata(self, path, token):
+        """Get metadata from IMDSv2"""
         try:
             req = urlopen(
-                self.TOKEN_URL,
-                data=None,
+                Request(f"{self.METADATA_URL}{path}", headers={'X-aws-ec2-metadata-token': token}),
                 timeout=self.TIMEOUT
             )
-            self.token = req.read().decode('utf-8')
-            return self.token
+            return req.read().decode('utf-8').strip()
         except Exception:
             return None
     
-    def _get_metadata(self, path):
-        """Get metadata from IMDSv2"""
-        if not self.available:
-            return None
-        
+    def fetch_snapshot(self):
+        """Read every metadata path concurrently and return a new snapshot"""
         token = self._get_token()
         if not token:
-            return None
+            return MetadataSnapshot(False)
         
-        try:
-            req = urlopen(
-                f"{self.METADATA_URL}{path}",
-                timeout=self.TIMEOUT
-            )
-            return req.read().decode('utf-8').strip()
-        except Exception:
-            return None
+        with ThreadPoolExecutor(max_workers=len(self.PATHS)) as executor:
+            futures = {
+                name: executor.submit(self._get_metadata, path, token)
+                for name, path in self.PATHS.items()
+            }
+            return MetadataSnapshot(True, {name: future.result() for name, future in futures.items()})
     
-    @property
-    def instance_id(self):
-        return self._get_metadata("instance-id") or "N/A"
+    def start_refresh(self, interval):
+        """Re-read the metadata every interval seconds on a background thread"""
+        def refresh():
+            while True:
+                time.sleep(interval)
+                snapshot = self.fetch_snapshot()
+                # Keep the last good snapshot through a transient IMDS failure
+                if snapshot.available or not self.snapshot.available:
+                    self.snapshot = snapshot
+        
+        self.refresh_thread = threading.Thread(target=refresh, name='metadata-refresh', daemon=True)
+        self.refresh_thread.start()
+
+
+def render_html(title, content):
+    """Fill the page template and encode it for sending"""
+    return HTML_TEMPLATE.format(title=title, content=content).encode('utf-8')
+
+
+def render_root(region, metadata):
+    """Main landing page"""
+    content = '<h1>Hello from CloudAge</h1>'
+    content += '<h1>What to watch next....</h1>'
     
-    @property
-    def instance_type(self):
-        return self._get_metadata("instance-type") or "N/A"
+    # Show region info
+    content += f'<div class="info"><strong>Region:</strong> {region}</div>'
     
-    @property
-    def availability_zone(self):
-        return self._get_metadata("placement/availability-zone") or "N/A"
+    # Show EC2 info if available
+    if metadata.available:
+        content += '<div class="info success">'
+        content += '<strong>Running on EC2 Instance</strong><br>'
+        content += f'<strong>Instance ID:</strong> {metadata.instance_id}<br>'
+        content += f'<strong>Availability Zone:</strong> {metadata.availability_zone}'
+        content += '</div>'
+    else:
+        content += '<div class="info">'
+        content += '<strong>Environment:</strong> Local/Non-EC2 environment'
+        content += '</div>'
     
-    @property
-    def region(self):
-        az = self.availability_zone
-        if az and az != "N/A":
-            return az[:-1]  # Remove last character (zone letter)
-        return None
+    # Navigation
+    content += '<div class="footer">'
+    content += '<strong>Available Endpoints:</strong><br>'
+    content += '<a href="/">Home</a> | '
+    content += '<a href="/healthcheck">Health Check</a> | '
+    content += '<a href="/info">Server Info</a>'
+    content += '</div>'
     
-    @property
-    def private_ipv4(self):
-        return self._get_metadata("local-ipv4") or "N/A"
+    return 200, render_html("AWS CloudAge", content)
+
+
+def render_healthcheck(region):
+    """Health check endpoint for load balancers"""
+    content = '<h1>Success</h1>'
+    content += '<div class="info success">'
+    content += '<strong>Status:</strong> Server is healthy and operational<br>'
+    content += f'<strong>Region:</strong> {region}'
+    content += '</div>'
+    content += '<div class="footer"><a href="/">← Back to Home</a></div>'
     
-    @property
-    def public_ipv4(self):
-        return self._get_metadata("public-ipv4") or "N/A"
+    return 200, render_html("Health Check", content)
 
 
-class RobustRequestHandler(BaseHTTPRequestHandler):
-    """HTTP Request Handler with complete error handling"""
+def render_info(region, metadata, server_address):
+    """Detailed server information"""
+    content = '<h1>Server Information</h1>'
+    
+    # Server details
+    content += '<div class="info">'
+    content += f'<strong>Region:</strong> {region}<br>'
+    content += f'<strong>Server Address:</strong> {server_address[0]}:{server_address[1]}<br>'
+    content += f'<strong>Python Version:</strong> {sys.version.split()[0]}'
+    content += '</div>'
+    
+    # EC2 metadata if available
+    if metadata.available:
+        content += '<h2>EC2 Instance Details</h2>'
+        content += '<div class="info success">'
+        content += f'<strong>Instance ID:</strong> {metadata.instance_id}<br>'
+        content += f'<strong>Instance Type:</strong> {metadata.instance_type}<br>'
+        content += f'<strong>Availability Zone:</strong> {metadata.availability_zone}<br>'
+        content += f'<strong>Private IPv4:</strong> {metadata.private_ipv4}<br>'
+        content += f'<strong>Public IPv4:</strong> {metadata.public_ipv4}'
+        content += '</div>'
+    else:
+        content += '<div class="info">'
+        content += '<strong>EC2 Metadata:</strong> Not available (not running on EC2 or metadata service disabled)'
+        content += '</div>'
+    
+    content += '<div class="footer"><a href="/">← Back to Home</a></div>'
+    
+    return 200, render_html("Server Information", content)
+
+
+def render_404(path):
+    """404 Not Found page"""
+    content = '<h1>404 - Page Not Found</h1>'
+    content += f'<div class="info error">'
+    content += f'The requested path <code>{html.escape(path)}</code> was not found on this server.'
+    content += '</div>'
+    content += '<div class="footer"><a href="/">← Back to Home</a></div>'
+    
+    return 404, render_html("404 Not Found", content)
+
+
+def render_error(error_message):
+    """500 Internal Server Error page"""
+    content = '<h1>500 - Internal Server Error</h1>'
+    content += '<div class="info error">'
+    content += f'<strong>Error:</strong> {html.escape(error_message)}'
+    content += '</div>'
+    content += '<div class="footer"><a href="/">← Back to Home</a></div>'
+    
+    return 500, render_html("Internal Server Error", content)
+
+
+def render_route(path, region, metadata, server_address):
+    """Render the page for a GET path; shared by every serving mode"""
+    try:
+        if path == '/':
+            return render_root(region, metadata)
+        elif path == '/healthcheck':
+            return render_healthcheck(region)
+        elif path == '/info':
+            return render_info(region, metadata, server_address)
+        else:
+            return render_404(path)
+    except Exception as e:
+        return render_error(str(e))
+
+
+@lru_cache(maxsize=256)
+def accepted_encodings(accept_encoding):
+    """Content codings a client accepts, from its Accept-Encoding header"""
+    encodings = set()
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        if params.replace(' ', '').lower() in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        encodings.add(coding.strip().lower())
+    return frozenset(encodings)
+
+
+def etag_matches(if_none_match, etag):
+    """True when an If-None-Match header names the given ETag (weak comparison)"""
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*' or tag.removeprefix('W/') == etag:
+            return True
+    return False
+
+
+class CachedResponse:
+    """A page rendered once into bytes, with precompressed variants and their ETags"""
+    
+    __slots__ = ('status', 'variants')
+    
+    def __init__(self, status, body):
+        self.status = status
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        encoded = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            encoded['br'] = brotli.compress(body)
+        
+        # encoding -> (body, etag, full headers, 304 headers)
+        self.variants = {}
+        for encoding, data in encoded.items():
+            etag = f'"{digest}"' if encoding == 'identity' else f'"{digest}-{encoding}"'
+            validators = (('ETag', etag), ('Cache-Control', 'no-cache'), ('Vary', 'Accept-Encoding'))
+            headers = (
+                ('Content-type', 'text/html; charset=utf-8'),
+                ('Content-Length', str(len(data))),
+            ) + validators
+            if encoding != 'identity':
+                headers += (('Content-Encoding', encoding),)
+            self.variants[encoding] = (data, etag, headers, validators)
+    
+    def select(self, accept_encoding):
+        """Pick the smallest variant the client accepts"""
+        if accept_encoding:
+            encodings = accepted_encodings(accept_encoding)
+            for encoding in ENCODING_PREFERENCE:
+                if encoding in encodings and encoding in self.variants:
+                    return self.variants[encoding]
+        return self.variants['identity']
+
+
+class ResponseCache:
+    """Prerendered responses of CACHED_ROUTES, rebuilt whenever the metadata snapshot changes"""
     
-    def __init__(self, region, metadata, *args, **kwargs):
+    def __init__(self, region, metadata, server_address):
         self.region = region
         self.metadata = metadata
+        self.server_address = server_address
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.responses = {}
+        self.rebuild(metadata.snapshot)
+    
+    def rebuild(self, snapshot):
+        with self.lock:
+            if snapshot is self.snapshot:
+                return
+            self.responses = {
+                path: CachedResponse(*render_route(path, self.region, snapshot, self.server_address))
+                for path in CACHED_ROUTES
+            }
+            self.snapshot = snapshot
+    
+    def lookup(self, path):
+        snapshot = self.metadata.snapshot
+        if snapshot is not self.snapshot:
+            self.rebuild(snapshot)
+        return self.responses.get(path)
+    
+    def respond(self, path, accept_encoding, if_none_match):
+        """Return (status, headers, body) for a GET; uncached paths such as 404s render on demand"""
+        response = self.lookup(path)
+        if response is None:
+            status_code, body = render_route(path, self.region, self.metadata.snapshot, self.server_address)
+            headers = (
+                ('Content-type', 'text/html; charset=utf-8'),
+                ('Content-Length', str(len(body))),
+            ) + NO_CACHE_HEADERS
+            return status_code, headers, body
+        
+        body, etag, headers, validators = response.select(accept_encoding)
+        if if_none_match and etag_matches(if_none_match, etag):
+            return 304, validators, b''
+        return response.status, headers, body
+
+
+class ServerState:
+    """Drain flag and readiness of the running server"""
+    
+    # Metadata older than this many refresh intervals means IMDS refreshes are failing
+    STALE_REFRESH_INTERVALS = 3
+    
+    def __init__(self, metadata, refresh_interval, probe_log_rate, log_sample_rate=1.0):
+        self.metadata = metadata
+        self.refresh_interval = refresh_interval
+        self.probe_log_rate = probe_log_rate
+        self.log_sample_rate = log_sample_rate
+        self.draining = threading.Event()
+    
+    def is_ready(self):
+        """Ready once the metadata snapshot is loaded (and fresh, when refreshing) and not draining"""
+        if self.draining.is_set():
+            return False
+        snapshot = self.metadata.snapshot
+        if snapshot is None:
+            return False
+        if self.refresh_interval and snapshot.available:
+            return time.time() - snapshot.fetched_at < self.STALE_REFRESH_INTERVALS * self.refresh_interval
+        return True
+    
+    def should_log(self, path):
+        """Sample page requests at --log_sample_rate and probe requests at --probe_log_rate"""
+        rate = self.probe_log_rate if path in PROBE_PATHS else self.log_sample_rate
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def respond(path, accept_encoding, if_none_match, response_cache, state):
+    """Return (status, headers, body) for a GET path; shared by every serving mode"""
+    if path == '/livez':
+        return LIVE_RESPONSE
+    if path == '/readyz':
+        if state.is_ready():
+            return READY_RESPONSE
+        return DRAINING_RESPONSE if state.draining.is_set() else NOT_READY_RESPONSE
+    return response_cache.respond(path, accept_encoding, if_none_match)
+
+
+class AccessLogger:
+    """Non-blocking log pipeline: requests enqueue records, a background thread formats and writes them in batches"""
+    
+    QUEUE_SIZE = 10000
+    BATCH_SIZE = 512
+    FLUSH_INTERVAL = 0.5  # Seconds a record may wait before its batch is written
+    
+    def __init__(self, log_format='text', stream=None):
+        self.log_format = log_format
+        self.stream = stream or sys.stdout
+        self.records = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self.dropped = 0
+        self.reported_dropped = 0
+        self.thread = threading.Thread(target=self.run, name='access-log', daemon=True)
+        self.stopping = threading.Event()
+    
+    def start(self):
+        self.thread.start()
+        return self
+    
+    def log(self, record):
+        """Queue a message string or an access tuple (time, client, request line, status, bytes, latency)"""
+        try:
+            self.records.put_nowait(record)
+        except queue.Full:
+            # Never make a request wait for the log writer
+            self.dropped += 1
+    
+    def format(self, record):
+        if isinstance(record, str):
+            if self.log_format == 'json':
+                return json.dumps({'time': self.format_time(time.time(), iso=True), 'message': record})
+            return record
+        
+        logged_at, client, request_line, status, size, latency = record
+        if self.log_format == 'json':
+            method, _, rest = request_line.partition(' ')
+            path, _, protocol = rest.rpartition(' ')
+            return json.dumps({
+                'time': self.format_time(logged_at, iso=True),
+                'client': client,
+                'method': method,
+                'path': path,
+                'protocol': protocol,
+                'status': status,
+                'bytes': size,
+                'latency_ms': round(latency * 1000, 3) if latency is not None else None,
+            })
+        latency_text = f" {latency * 1000:.2f}ms" if latency is not None else ""
+        return f"[{self.format_time(logged_at)}] {client} \"{request_line}\" {status} {size}{latency_text}"
+    
+    @staticmethod
+    def format_time(timestamp, iso=False):
+        if iso:
+            return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(timestamp)) + f".{int(timestamp % 1 * 1000):03d}Z"
+        return time.strftime('%d/%b/%Y %H:%M:%S', time.localtime(timestamp))
+    
+    def run(self):
+        """Writer thread: block for the first record, then drain up to a batch and write it in one call"""
+        while not (self.stopping.is_set() and self.records.empty()):
+            try:
+                batch = [self.records.get(timeout=self.FLUSH_INTERVAL)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            
+            lines = [self.format(record) for record in batch]
+            dropped = self.dropped
+            if dropped != self.reported_dropped:
+                lines.append(self.format(f"{dropped - self.reported_dropped} log records dropped (queue full)"))
+                self.reported_dropped = dropped
+            try:
+                self.stream.write("\n".join(lines) + "\n")
+                self.stream.flush()
+            except Exception as e:
+                sys.stderr.write(f"Error writing access log: {e}\n")
+    
+    def close(self, timeout=2.0):
+        """Write out what is queued and stop the writer thread"""
+        self.stopping.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+
+
+# Replaced by a started AccessLogger in main(); until then log lines are written directly
+access_log = None
+
+
+def write_log(record):
+    """Queue one access/error log record, or write it straight away before logging starts"""
+    if access_log is not None:
+        access_log.log(record)
+    else:
+        sys.stdout.write(f"{record}\n")
+        sys.stdout.flush()
+
+
+class RobustRequestHandler(BaseHTTPRequestHandler):
+    """HTTP Request Handler with complete error handling and HTTP/1.1 keep-alive"""
+    
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes, so don't let Nagle hold back the body
+    disable_nagle_algorithm = True
+    
+    def __init__(self, keepalive_timeout, keep_alive, *args, **kwargs):
+        self.in_get = False
+        # Idle or stalled connections are closed after this many seconds
+        self.timeout = keepalive_timeout
+        if not keep_alive:
+            # One request per connection, so a single-threaded server is never held by an idle client
+            self.protocol_version = 'HTTP/1.0'
         super().__init__(*args, **kwargs)
     
     def log_message(self, format, *args):
-        """Custom logging to stdout"""
-        sys.stdout.write(f"[{self.log_date_time_string()}] {format % args}\n")
-        sys.stdout.flush()
+        """Custom logging through the background log writer"""
+        write_log(f"[{self.log_date_time_string()}] {format % args}")
+    
+    def log_access(self, code, size, latency=None):
+        """Queue an access record if the path is sampled"""
+        if self.server.state.should_log(getattr(self, 'path', None)):
+            write_log((time.time(), self.client_address[0], self.requestline, int(code), size, latency))
     
-    def send_html_response(self, status_code, title, content):
-        """Send HTML response with error handling"""
+    def log_request(self, code='-', size='-'):
+        """Access record for responses sent outside do_GET (errors); do_GET logs after writing the body"""
+        if not self.in_get:
+            self.log_access(code, size)
+    
+    def send_prepared_response(self, status_code, headers, body):
+        """Send a response whose headers and body are already built, with error handling"""
         try:
             self.send_response(status_code)
-            self.send_header('Content-type', 'text/html; charset=utf-8')
-            self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
-            self.send_header('Pragma', 'no-cache')
-            self.send_header('Expires', '0')
+            for name, value in headers:
+                self.send_header(name, value)
+            if self.server.state.draining.is_set():
+                # Ask keep-alive clients to reconnect elsewhere while the load balancer drains us
+                self.send_header('Connection', 'close')
             self.end_headers()
             
-            html = HTML_TEMPLATE.format(title=title, content=content)
-            self.wfile.write(html.encode('utf-8'))
+            if body:
+                self.wfile.write(body)
         except Exception as e:
             sys.stderr.write(f"Error sending response: {e}\n")
+            self.close_connection = True
     
     def do_GET(self):
-        """Handle GET requests"""
+        """Handle GET requests from the prerendered response cache"""
+        started = time.perf_counter()
+        self.in_get = True
+        status_code, headers, body = respond(
+            self.path,
+            self.headers.get('Accept-Encoding'),
+            self.headers.get('If-None-Match'),
+            self.server.response_cache,
+            self.server.state
+        )
+        try:
+            self.send_prepared_response(status_code, headers, body)
+        finally:
+            self.in_get = False
+        self.log_access(status_code, len(body), time.perf_counter() - started)
+
+
+class PooledHTTPServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer that serves connections on a bounded worker pool instead of a thread each"""
+    
+    def __init__(self, server_address, handler, workers):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http-worker')
+        super().__init__(server_address, handler, bind_and_activate=False)
+    
+    def process_request(self, request, client_address):
+        """Queue the connection for the next free worker"""
+        self.executor.submit(self.process_request_thread, request, client_address)
+    
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
+
+class AsyncHTTPServer:
+    """asyncio HTTP/1.1 server with keep-alive, sharing the page rendering of RobustRequestHandler"""
+    
+    MAX_HEADER_LINES = 100
+    
+    def __init__(self, config, region, metadata, state):
+        self.config = config
+        self.state = state
+        self.region = region
+        self.metadata = metadata
+        self.server_address = (config['ip'], config['port'])
+        self.response_cache = ResponseCache(region, metadata, self.server_address)
+        self.stop_event = None
+        self.loop = None
+    
+    def build_response(self, status_code, headers, body, keep_alive):
+        """Status line, headers and body of one response"""
+        status = HTTPStatus(status_code)
+        lines = [
+            f"HTTP/1.1 {status.value} {status.phrase}",
+            "Server: CloudAgeAsync",
+            f"Date: {formatdate(usegmt=True)}",
+        ]
+        lines += [f"{name}: {value}" for name, value in headers]
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body
+    
+    def build_html_response(self, status_code, body, keep_alive):
+        """Response for a page rendered on the spot"""
+        headers = (
+            ('Content-type', 'text/html; charset=utf-8'),
+            ('Content-Length', str(len(body))),
+        ) + NO_CACHE_HEADERS
+        return self.build_response(status_code, headers, body, keep_alive)
+    
+    async def read_request(self, reader):
+        """Read a request line and its headers, or None when the client goes away"""
+        timeout = self.config['keepalive_timeout']
+        request_line = await asyncio.wait_for(reader.readline(), timeout)
+        if not request_line:
+            return None
+        headers = {}
+        for _ in range(self.MAX_HEADER_LINES):
+            line = await asyncio.wait_for(reader.readline(), timeout)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return request_line.decode('latin-1').strip(), headers
+    
+    async def handle_connection(self, reader, writer):
+        """Serve requests on one connection until it closes or goes idle"""
+        client = writer.get_extra_info('peername') or ('-', 0)
         try:
-            if self.path == '/':
-                self.handle_root()
-            elif self.path == '/healthcheck':
-                self.handle_healthcheck()
-            elif self.path == '/info':
-                self.handle_info()
-            else:
-                self.handle_404()
+            while not self.stop_event.is_set():
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                request_line, headers = request
+                parts = request_line.split()
+                if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+                    body = render_html("400 Bad Request", '<h1>400 - Bad Request</h1>')
+                    writer.write(self.build_html_response(400, body, False))
+                    await writer.drain()
+                    break
+                method, path, version = parts
+                
+                # Discard any request body so the next request starts at a clean boundary
+                length = int(headers.get('content-length', 0) or 0)
+                if length:
+                    await reader.readexactly(length)
+                
+                connection = headers.get('connection', '').lower()
+                if version == 'HTTP/1.0':
+                    keep_alive = connection == 'keep-alive'
+                else:
+                    keep_alive = connection != 'close'
+                keep_alive = keep_alive and not self.stop_event.is_set() and not self.state.draining.is_set()
+                
+                started = time.perf_counter()
+                if method == 'GET':
+                    status_code, response_headers, body = respond(
+                        path,
+                        headers.get('accept-encoding'),
+                        headers.get('if-none-match'),
+                        self.response_cache,
+                        self.state
+                    )
+                    writer.write(self.build_response(status_code, response_headers, body, keep_alive))
+                else:
+                    status_code, body = 501, render_html("501 Not Implemented", '<h1>501 - Not Implemented</h1>')
+                    writer.write(self.build_html_response(status_code, body, keep_alive))
+                
+                await writer.drain()
+                if self.state.should_log(path):
+                    write_log((time.time(), client[0], request_line, status_code, len(body), time.perf_counter() - started))
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
         except Exception as e:
-            self.handle_error(str(e))
+            sys.stderr.write(f"Error serving connection: {e}\n")
+        finally:
+            writer.close()
     
-    def handle_root(self):
-        """Main landing page"""
-        content = '<h1>Hello from CloudAge</h1>'
-        content += '<h1>What to watch next....</h1>'
-        
-        # Show region info
-        content += f'<div class="info"><strong>Region:</strong> {self.region}</div>'
-        
-        # Show EC2 info if available
-        if self.metadata.available:
-            content += '<div class="info success">'
-            content += '<strong>Running on EC2 Instance</strong><br>'
-            content += f'<strong>Instance ID:</strong> {self.metadata.instance_id}<br>'
-            content += f'<strong>Availability Zone:</strong> {self.metadata.availability_zone}'
-            content += '</div>'
-        else:
-            content += '<div class="info">'
-            content += '<strong>Environment:</strong> Local/Non-EC2 environment'
-            content += '</div>'
-        
-        # Navigation
-        content += '<div class="footer">'
-        content += '<strong>Available Endpoints:</strong><br>'
-        content += '<a href="/">Home</a> | '
-        content += '<a href="/healthcheck">Health Check</a> | '
-        content += '<a href="/info">Server Info</a>'
-        content += '</div>'
-        
-        self.send_html_response(200, "AWS CloudAge", content)
+    async def serve(self):
+        """Accept connections until stop() is called"""
+        self.loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        server = await asyncio.start_server(
+            self.handle_connection,
+            self.config['ip'],
+            self.config['port'],
+            backlog=self.config['backlog'],
+            reuse_address=True,
+        )
+        async with server:
+            await self.stop_event.wait()
     
-    def handle_healthcheck(self):
-        """Health check endpoint for load balancers"""
-        content = '<h1>Success</h1>'
-        content += '<div class="info success">'
-        content += '<strong>Status:</strong> Server is healthy and operational<br>'
-        content += f'<strong>Region:</strong> {self.region}'
-        content += '</div>'
-        content += '<div class="footer"><a href="/">← Back to Home</a></div>'
-        
-        self.send_html_response(200, "Health Check", content)
+    def serve_forever(self):
+        asyncio.run(self.serve())
     
-    def handle_info(self):
-        """Detailed server information"""
-        content = '<h1>Server Information</h1>'
-        
-        # Server details
-        content += '<div class="info">'
-        content += f'<strong>Region:</strong> {self.region}<br>'
-        content += f'<strong>Server Address:</strong> {self.server.server_address[0]}:{self.server.server_address[1]}<br>'
-        content += f'<strong>Python Version:</strong> {sys.version.split()[0]}'
-        content += '</div>'
-        
-        # EC2 metadata if available
-        if self.metadata.available:
-            content += '<h2>EC2 Instance Details</h2>'
-            content += '<div class="info success">'
-            content += f'<strong>Instance ID:</strong> {self.metadata.instance_id}<br>'
-            content += f'<strong>Instance Type:</strong> {self.metadata.instance_type}<br>'
-            content += f'<strong>Availability Zone:</strong> {self.metadata.availability_zone}<br>'
-            content += f'<strong>Private IPv4:</strong> {self.metadata.private_ipv4}<br>'
-            content += f'<strong>Public IPv4:</strong> {self.metadata.public_ipv4}'
-            content += '</div>'
-        else:
-            content += '<div class="info">'
-            content += '<strong>EC2 Metadata:</strong> Not available (not running on EC2 or metadata service disabled)'
-            content += '</div>'
-        
-        content += '<div class="footer"><a href="/">← Back to Home</a></div>'
-        
-        self.send_html_response(200, "Server Information", content)
+    def stop(self):
+        """Stop accepting connections; safe to call from a signal handler"""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+
+
+def create_server(config, region, metadata, state):
+    """Build the server for the selected --mode"""
+    if config['mode'] == 'async':
+        return AsyncHTTPServer(config, region, metadata, state)
     
-    def handle_404(self):
-        """404 Not Found page"""
-        content = '<h1>404 - Page Not Found</h1>'
-        content += f'<div class="info error">'
-        content += f'The requested path <code>{self.path}</code> was not found on this server.'
-        content += '</div>'
-        content += '<div class="footer"><a href="/">← Back to Home</a></div>'
-        
-        self.send_html_response(404, "404 Not Found", content)
+    server_address = (config['ip'], config['port'])
+    keep_alive = config['mode'] == 'threaded'
+    handler = partial(RobustRequestHandler, config['keepalive_timeout'], keep_alive)
+    if keep_alive:
+        httpd = PooledHTTPServer(server_address, handler, config['workers'])
+    else:
+        httpd = HTTPServer(server_address, handler, bind_and_activate=False)
     
-    def handle_error(self, error_message):
-        """500 Internal Server Error page"""
-        content = '<h1>500 - Internal Server Error</h1>'
-        content += '<div class="info error">'
-        content += f'<strong>Error:</strong> {error_message}'
-        content += '</div>'
-        content += '<div class="footer"><a href="/">← Back to Home</a></div>'
-        
-        self.send_html_response(500, "Internal Server Error", content)
+    # Pending connections the kernel queues while all workers are busy
+    httpd.request_queue_size = config['backlog']
+    try:
+        httpd.server_bind()
+        httpd.server_activate()
+    except Exception:
+        httpd.server_close()
+        raise
+    
+    # Render the static routes once; handlers only look them up
+    httpd.response_cache = ResponseCache(region, metadata, httpd.server_address)
+    httpd.state = state
+    
+    # shutdown() waits for serve_forever() to return, so it must not run on the serving thread
+    httpd.stop = lambda: threading.Thread(target=httpd.shutdown, daemon=True).start()
+    return httpd
 
 
 def parse_arguments(args):
@@ -268,7 +805,16 @@ def parse_arguments(args):
     config = {
         'ip': '0.0.0.0',
         'port': 8080,
-        'region': None
+        'region': None,
+        'mode': 'threaded',
+        'workers': 64,
+        'backlog': 1024,
+        'keepalive_timeout': 5.0,
+        'metadata_refresh': 0.0,
+        'drain_grace': 0.0,
+        'probe_log_rate': 0.0,
+        'log_format': 'text',
+        'log_sample_rate': 1.0
     }
     
     i = 0
@@ -303,6 +849,77 @@ def parse_arguments(args):
                 config['region'] = args[i + 1]
                 i += 1
         
+        elif arg in ('-m', '--mode'):
+            if i + 1 < len(args):
+                if args[i + 1] not in SERVER_MODES:
+                    print(f"Error: Mode must be one of: {', '.join(SERVER_MODES)}")
+                    sys.exit(1)
+                config['mode'] = args[i + 1]
+                i += 1
+        
+        elif arg in ('-w', '--workers', '-b', '--backlog'):
+            if i + 1 < len(args):
+                key = 'workers' if arg in ('-w', '--workers') else 'backlog'
+                try:
+                    value = int(args[i + 1])
+                    if value < 1:
+                        print(f"Error: {arg} must be at least 1")
+                        sys.exit(1)
+                    config[key] = value
+                except ValueError:
+                    print(f"Error: Invalid number for {arg}: {args[i + 1]}")
+                    sys.exit(1)
+                i += 1
+        
+        elif arg in ('-i', '--metadata_refresh'):
+            if i + 1 < len(args):
+                try:
+                    config['metadata_refresh'] = max(0.0, float(args[i + 1]))
+                except ValueError:
+                    print(f"Error: Invalid refresh interval: {args[i + 1]}")
+                    sys.exit(1)
+                i += 1
+        
+        elif arg in ('-g', '--drain_grace'):
+            if i + 1 < len(args):
+                try:
+                    config['drain_grace'] = max(0.0, float(args[i + 1]))
+                except ValueError:
+                    print(f"Error: Invalid drain grace period: {args[i + 1]}")
+                    sys.exit(1)
+                i += 1
+        
+        elif arg in ('-l', '--probe_log_rate', '-a', '--log_sample_rate'):
+            if i + 1 < len(args):
+                key = 'probe_log_rate' if arg in ('-l', '--probe_log_rate') else 'log_sample_rate'
+                try:
+                    rate = float(args[i + 1])
+                    if not 0 <= rate <= 1:
+                        print(f"Error: {arg} must be between 0 and 1")
+                        sys.exit(1)
+                    config[key] = rate
+                except ValueError:
+                    print(f"Error: Invalid rate for {arg}: {args[i + 1]}")
+                    sys.exit(1)
+                i += 1
+        
+        elif arg in ('-f', '--log_format'):
+            if i + 1 < len(args):
+                if args[i + 1] not in LOG_FORMATS:
+                    print(f"Error: Log format must be one of: {', '.join(LOG_FORMATS)}")
+                    sys.exit(1)
+                config['log_format'] = args[i + 1]
+                i += 1
+        
+        elif arg in ('-k', '--keepalive_timeout'):
+            if i + 1 < len(args):
+                try:
+                    config['keepalive_timeout'] = float(args[i + 1])
+                except ValueError:
+                    print(f"Error: Invalid timeout: {args[i + 1]}")
+                    sys.exit(1)
+                i += 1
+        
         else:
             print(f"Unknown argument: {arg}")
             print_usage()
@@ -325,6 +942,20 @@ Options:
     -s, --server_ip IP      Server IP address (default: 0.0.0.0)
     -p, --server_port PORT  Server port (default: 8080)
     -r, --region REGION     AWS region override (auto-detected on EC2)
+    -m, --mode MODE         single (HTTP/1.0), threaded or async (default: threaded)
+    -w, --workers N         Worker threads for threaded mode (default: 64)
+    -b, --backlog N         Listen backlog of pending connections (default: 1024)
+    -k, --keepalive_timeout SECONDS
+                            Close idle or stalled connections after this long (default: 5)
+    -i, --metadata_refresh SECONDS
+                            Re-read EC2 metadata in the background this often (default: 0, read once)
+    -g, --drain_grace SECONDS
+                            On SIGTERM, fail /readyz and keep serving this long before stopping (default: 0)
+    -l, --probe_log_rate RATE
+                            Fraction of /livez, /readyz and /healthcheck requests to log (default: 0)
+    -a, --log_sample_rate RATE
+                            Fraction of other requests to log (default: 1)
+    -f, --log_format FORMAT text, or json with latency and bytes sent (default: text)
 
 Examples:
     python3 server.py
@@ -332,19 +963,27 @@ Examples:
     python3 server.py -s 127.0.0.1 -p 3000
     sudo python3 server.py -p 80
     python3 server.py -r us-west-2
+    python3 server.py -m async -b 4096
+    python3 server.py -m threaded -w 128
+    python3 server.py -g 30 -l 0.01
+    python3 server.py -f json -a 0.1
 
 Features:
     ✓ No external dependencies (uses only Python standard library)
-    ✓ Auto-detects EC2 metadata (IMDSv2 compatible)
+    ✓ Auto-detects EC2 metadata (IMDSv2 compatible), read once at startup
     ✓ Graceful fallback for non-EC2 environments
-    ✓ Health check endpoint for load balancers
+    ✓ Health check endpoint for load balancers, plus /livez and /readyz probes
+    ✓ Prerendered pages with gzip (and brotli, if installed), ETag and 304 support
+    ✓ Single, threaded (bounded pool) and asyncio serving with HTTP/1.1 keep-alive
     ✓ Comprehensive error handling
+    ✓ Buffered access logging on a background thread (text or JSON)
     ✓ Clean shutdown with Ctrl+C
 """)
 
 
 def main():
     """Main entry point"""
+    global access_log
     
     # Parse arguments
     config = parse_arguments(sys.argv[1:])
@@ -352,12 +991,14 @@ def main():
     # Initialize EC2 metadata
     print("Checking EC2 metadata availability...")
     metadata = EC2Metadata()
+    if metadata.available and config['metadata_refresh']:
+        metadata.start_refresh(config['metadata_refresh'])
     
     # Determine region
     region = config['region']
     if not region:
         if metadata.available:
-            region = metadata.region or 'us-east-1'
+            region = metadata.snapshot.region or 'us-east-1'
             print(f"Detected EC2 region: {region}")
         else:
             region = 'us-east-1'
@@ -379,18 +1020,20 @@ def main():
     
     # Create server
     try:
-        server_address = (config['ip'], config['port'])
-        handler = partial(RobustRequestHandler, region, metadata)
-        httpd = HTTPServer(server_address, handler)
+        state = ServerState(
+            metadata, config['metadata_refresh'], config['probe_log_rate'], config['log_sample_rate']
+        )
+        httpd = create_server(config, region, metadata, state)
         
         print("\n" + "=" * 70)
         print("🚀 Server Started Successfully")
         print("=" * 70)
         print(f"Address:  {config['ip']}:{config['port']}")
         print(f"Region:   {region}")
+        print(f"Mode:     {config['mode']} (workers: {config['workers']}, backlog: {config['backlog']})")
         
         if metadata.available:
-            print(f"Instance: {metadata.instance_id}")
+            print(f"Instance: {metadata.snapshot.instance_id}")
         
         # Determine access URL
         access_host = 'localhost' if config['ip'] == '0.0.0.0' else config['ip']
@@ -399,21 +1042,37 @@ def main():
         print(f"  • Main page:    http://{access_host}:{config['port']}/")
         print(f"  • Health check: http://{access_host}:{config['port']}/healthcheck")
         print(f"  • Server info:  http://{access_host}:{config['port']}/info")
+        print(f"  • Liveness:     http://{access_host}:{config['port']}/livez")
+        print(f"  • Readiness:    http://{access_host}:{config['port']}/readyz")
         print("\nPress Ctrl+C to stop the server")
         print("=" * 70 + "\n")
         
         # Setup signal handlers for graceful shutdown
         def signal_handler(signum, frame):
+            if signum == signal.SIGTERM and config['drain_grace'] and not state.draining.is_set():
+                # Fail readiness first so the load balancer stops sending new requests
+                print(f"\n\nSIGTERM received, draining for {config['drain_grace']:g} seconds...")
+                state.draining.set()
+                timer = threading.Timer(config['drain_grace'], httpd.stop)
+                timer.daemon = True
+                timer.start()
+                return
             print("\n\nShutdown signal received, stopping server...")
-            httpd.shutdown()
-            print("Server stopped successfully")
-            sys.exit(0)
+            httpd.stop()
         
         signal.signal(signal.SIGINT, signal_handler)
         signal.signal(signal.SIGTERM, signal_handler)
         
+        # Access log lines go through a background writer from here on
+        access_log = AccessLogger(config['log_format']).start()
+        
         # Start serving
         httpd.serve_forever()
+        if config['mode'] != 'async':
+            httpd.server_close()
+        access_log.close()
+        print("Server stopped successfully")
+        sys.exit(0)
         
     except PermissionError:
         print(f"\n❌ Error: Permission denied for port {config['port']}")